@@ -0,0 +1,343 @@
+"""
+Benchmarks for the documentation extensions in source/sphinxext.
+
+Times `split_content` in both extensions, `validate()` for every draft
+with every `--backend` that supports it, and a full read of the
+documentation through `SchemaExampleDirective.run`, over the real
+examples in source/ or a synthetic corpus `--scale` times larger.  Run
+from the repository root:
+
+    python benchmarks/bench_extensions.py --output results.json
+    python benchmarks/bench_extensions.py --baseline results.json
+
+With `--baseline`, exits non-zero if any benchmark got slower than the
+baseline by more than `--threshold`.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRCDIR = os.path.join(ROOT, 'source')
+sys.path.insert(0, SRCDIR)
+
+from sphinxext import jsonschemaext, tab  # noqa: E402
+
+
+def read_sources(srcdir):
+    for root, dirs, files in os.walk(srcdir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '_')))
+        for filename in sorted(files):
+            if filename.endswith('.rst'):
+                path = os.path.join(root, filename)
+                with open(path, encoding='utf-8') as fd:
+                    yield path, fd.read().splitlines()
+
+
+def load_corpus(srcdir):
+    examples = []
+    tabs = []
+    for path, lines in read_sources(srcdir):
+        for _, _, content, _, _ in jsonschemaext.extract_examples(lines):
+            examples.append(content)
+        for name in ('draft_specific', 'language_specific'):
+            for _, _, content, _, _ in jsonschemaext.extract_directives(
+                    lines, name):
+                tabs.append(content)
+    return examples, tabs
+
+
+def synthetic_examples(examples, scale):
+    # Every copy gets a distinct schema, so that the copies are compiled
+    # separately just like genuinely different examples would be.
+    split = []
+    for copy in range(scale):
+        for content in examples:
+            schema, parts = jsonschemaext.split_content(content)
+            if copy and isinstance(schema.json, dict):
+                schema.json = dict(schema.json, **{
+                    '$comment': 'synthetic copy {0}'.format(copy)})
+            split.append((schema, parts))
+    return split
+
+
+def reset_parts(split):
+    # Forget what `validate()` worked out and kept on the parts, so that
+    # every run does the same work as the first one.
+    for schema, parts in split:
+        for part in [schema] + parts:
+            part.digest = None
+            part.jschon = None
+
+
+def distinct_schemas(lines, copy):
+    # Like `synthetic_examples`, give every copy's schemas a distinct
+    # `$comment`, so that no copy is served from the result and validator
+    # caches filled by the ones before it.
+    lines = list(lines)
+    comment = '"$comment": "synthetic copy {0}"'.format(copy)
+    for _, _, content, first_line, _ in jsonschemaext.extract_examples(
+            lines):
+        try:
+            schema, parts = jsonschemaext.split_content(content)
+        except ValueError:
+            continue
+        if not isinstance(schema.json, dict):
+            continue
+        for i, line in enumerate(content):
+            if line in ('--', '--X'):
+                break
+            if line.lstrip('* ').startswith('{'):
+                index = first_line - 1 + i
+                rest = lines[index].split('{', 1)[1]
+                separator = ' ' if rest.lstrip().startswith('}') else ', '
+                lines[index] = lines[index].replace(
+                    '{', '{' + comment + separator, 1)
+                break
+    return lines
+
+
+def synthetic_srcdir(scale):
+    tmpdir = tempfile.mkdtemp(prefix='bench-src-')
+    srcdir = os.path.join(tmpdir, 'source')
+    shutil.copytree(SRCDIR, srcdir, ignore=shutil.ignore_patterns(
+        '__pycache__'))
+    for copy in range(1, scale):
+        for path, lines in read_sources(SRCDIR):
+            target = os.path.join(srcdir, 'copy{0}'.format(copy),
+                                  os.path.relpath(path, SRCDIR))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'w', encoding='utf-8') as fd:
+                fd.write(':orphan:\n\n' + '\n'.join(
+                    distinct_schemas(lines, copy)) + '\n')
+    return tmpdir, srcdir
+
+
+def best_of(repeat, func):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        count = func()
+        times.append(time.perf_counter() - start)
+    return {'seconds': min(times), 'count': count}
+
+
+def best_reported_of(repeat, func):
+    return {'seconds': min(func() for i in range(repeat)), 'count': 1}
+
+
+def bench_split_content(examples, tabs, scale):
+    def split_examples():
+        for copy in range(scale):
+            for content in examples:
+                jsonschemaext.split_content(content)
+        return len(examples) * scale
+
+    def split_tabs():
+        for copy in range(scale):
+            for content in tabs:
+                tab.split_content(content)
+        return len(tabs) * scale
+
+    return [('split_content[jsonschemaext]', split_examples),
+            ('split_content[tab]', split_tabs)]
+
+
+def bench_validate(examples, scale, backends):
+    split = synthetic_examples(examples, scale)
+
+    def make(backend, standard):
+        def run():
+            jsonschemaext.select_backend(backend)
+            jsonschemaext.validator_cache.clear()
+            reset_parts(split)
+            count = 0
+            for schema, parts in split:
+                for part in parts:
+                    try:
+                        jsonschemaext.validate(schema, part, standard)
+                    except ValueError:
+                        # Not a valid schema in this draft
+                        break
+                    count += 1
+            return count
+        return run
+
+    benchmarks = []
+    for backend in backends:
+        for standard in jsonschemaext.DRAFTS:
+            if backend == 'default':
+                name = 'validate[{0}]'.format(standard)
+            elif jsonschemaext.backends[backend].supports(standard):
+                name = 'validate[{0}][{1}]'.format(backend, standard)
+            else:
+                continue
+            benchmarks.append((name, make(backend, standard)))
+    return benchmarks
+
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {srcdir!r})
+import docutils.parsers.rst, sphinx.util.nodes
+start = time.perf_counter()
+import sphinxext.jsonschemaext, sphinxext.tab
+print(time.perf_counter() - start)
+"""
+
+
+def bench_import():
+    # In a fresh interpreter each time, after Sphinx itself is imported,
+    # so that only the extensions' own start-up cost is measured.
+    def run():
+        output = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_SCRIPT.format(srcdir=SRCDIR)])
+        return float(output)
+
+    return [('import[sphinxext]', run)]
+
+
+def bench_build(scale):
+    from sphinx.application import Sphinx
+
+    directive_time = [0.0]
+    directive_count = [0]
+    run = jsonschemaext.SchemaExampleDirective.run
+
+    def timed_run(self):
+        start = time.perf_counter()
+        try:
+            return run(self)
+        finally:
+            directive_time[0] += time.perf_counter() - start
+            directive_count[0] += 1
+
+    def build():
+        tmpdir, srcdir = synthetic_srcdir(scale)
+        jsonschemaext.validator_cache.clear()
+        directive_time[0] = 0.0
+        directive_count[0] = 0
+        jsonschemaext.SchemaExampleDirective.run = timed_run
+        try:
+            start = time.perf_counter()
+            app = Sphinx(srcdir, srcdir, os.path.join(tmpdir, 'out'),
+                         os.path.join(tmpdir, 'doctrees'), 'dummy',
+                         status=None, warning=io.StringIO(), freshenv=True)
+            app.build()
+            total = time.perf_counter() - start
+        finally:
+            jsonschemaext.SchemaExampleDirective.run = run
+            shutil.rmtree(tmpdir)
+        return total
+
+    def measure(repeat):
+        totals = [build() for i in range(repeat)]
+        return [
+            ('build[dummy]',
+             {'seconds': min(totals), 'count': directive_count[0]}),
+            ('SchemaExampleDirective.run',
+             {'seconds': directive_time[0], 'count': directive_count[0]}),
+        ]
+
+    return measure
+
+
+def run_benchmarks(args):
+    examples, tabs = load_corpus(SRCDIR)
+    results = {}
+    for name, func in (bench_split_content(examples, tabs, args.scale) +
+                       bench_validate(examples, args.scale, args.backend)):
+        results[name] = best_of(args.repeat, func)
+        print_result(name, results[name])
+    jsonschemaext.select_backend('default')
+    for name, func in bench_import():
+        results[name] = best_reported_of(args.repeat, func)
+        print_result(name, results[name])
+    if not args.skip_build:
+        for name, result in bench_build(args.scale)(args.repeat):
+            results[name] = result
+            print_result(name, result)
+    return results
+
+
+def print_result(name, result):
+    print('{0:<60} {1:>9.4f}s {2:>8}'.format(
+        name, result['seconds'], result['count']))
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print()
+    print('{0:<60} {1:>10} {2:>10} {3:>7}'.format(
+        'benchmark', 'baseline', 'current', 'ratio'))
+    for name in sorted(set(results) & set(baseline)):
+        before = baseline[name]['seconds']
+        after = results[name]['seconds']
+        ratio = after / before if before else float('inf')
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{0:<60} {1:>9.4f}s {2:>9.4f}s {3:>6.2f}x{4}'.format(
+            name, before, after, ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--scale', type=int, default=1,
+        help="size of the synthetic corpus, as a multiple of the real one")
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help="number of runs; the fastest one is reported")
+    parser.add_argument(
+        '--backend', action='append',
+        choices=['default'] + sorted(jsonschemaext.backends),
+        help="validator backend to time validate() with; may be repeated "
+             "(default: default)")
+    parser.add_argument(
+        '--skip-build', action='store_true',
+        help="skip the full Sphinx read of the documentation")
+    parser.add_argument(
+        '-o', '--output', help="write the results to this JSON file")
+    parser.add_argument(
+        '--baseline', help="compare against results saved with --output")
+    parser.add_argument(
+        '--threshold', type=float, default=1.25,
+        help="slowdown ratio counted as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+    args.backend = args.backend or ['default']
+
+    results = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fd:
+            json.dump({
+                'scale': args.scale,
+                'python': platform.python_version(),
+                'results': results,
+            }, fd, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fd:
+            baseline = json.load(fd)
+        if baseline.get('scale') != args.scale:
+            print('warning: baseline was run with --scale {0}'.format(
+                baseline.get('scale')))
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print('{0} benchmarks regressed'.format(len(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,5 @@
 #!/bin/sh
 
-make html latexpdf
+make site
 cp build/latex/*.pdf build/html
 exec "$@"
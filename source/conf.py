@@ -22,6 +22,63 @@ sys.path.insert(0, os.path.abspath(os.path.dirname('__file__')))
 # The default JSON Schema dialect to test the examples against
 jsonschema_standard = 'https://json-schema.org/draft/2020-12/schema'
 
+# Validate the examples in one batch once all documents have been read,
+# on a pool of this many processes (0 means one per CPU)
+#jsonschema_deferred_validation = False
+#jsonschema_validation_workers = 0
+
+# Give each validation at most this many seconds and MiB (0 for no
+# limit), each in a worker process that is stopped when it goes over.
+# The examples that do are reported with the slowest ones in
+# jsonschema-budget.json in the output directory, and the build goes on.
+# Either implies deferred validation.
+#jsonschema_validation_timeout = 0
+#jsonschema_validation_memory = 0
+#jsonschema_slowest_examples = 10
+
+# Instead of stopping at the first example that does not validate as
+# documented, record them all in jsonschema-failures.json in the output
+# directory and fail at the end of the build
+#jsonschema_keep_going = False
+
+# Dotted name of the function used to parse the examples; defaults to
+# orjson.loads when orjson is installed and json.loads otherwise
+#jsonschema_json_decoder = None
+
+# The validator backend: 'default' (jsonschema for draft 3 to 7, jschon
+# for 2019-09 and 2020-12), 'jsonschema', 'jschon' or 'fastjsonschema'.
+# Drafts the chosen backend does not implement use the default ones.
+#jsonschema_validator_backend = 'default'
+
+# Fail instances that do not match their "format", with jsonschema's
+# format checkers for every engine; formats that need jsonschema's
+# optional dependencies are only checked when those are installed
+#jsonschema_assert_formats = False
+
+# Time every example and tab directive and write jsonschema-profile.txt
+# and jsonschema-profile.json to the output directory
+#jsonschema_profile = False
+
+# Files read with the :schema:, :instance: and :invalid-instance: options
+# of schema_example may be at most this large (0 for no limit), and only
+# their first lines are shown
+#jsonschema_external_max_bytes = 64 * 1024 * 1024
+#jsonschema_external_preview_lines = 50
+
+# Directory of schemas, found by their $id, that examples may $ref
+# without embedding them.  Other references are not fetched and fail.
+jsonschema_schema_dir = '_schemas'
+
+# The Pygments lexer for the examples: 'javascript', or 'json' for a
+# stricter one.  Examples that are not valid JSON stay 'javascript'
+#jsonschema_highlight_language = 'javascript'
+
+# Also validate every example against every draft from draft 3 to 2020-12
+# and write the results to jsonschema-matrix.json in the output directory;
+# with the badges, each example lists the drafts it behaves as shown in
+#jsonschema_draft_matrix = False
+#jsonschema_draft_badges = False
+
 rst_prolog = """
 .. role:: new
 
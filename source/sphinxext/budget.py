@@ -0,0 +1,163 @@
+"""
+Validation under a time and memory budget, for
+`jsonschema_validation_timeout` and `jsonschema_validation_memory`.
+
+Every task runs in a worker process, so that one which never finishes,
+such as a regular expression that backtracks catastrophically, can be
+stopped: a worker still busy once its task is over the time budget is
+killed and replaced.  The memory budget caps the address space each
+worker may add to what it inherits, so a task that goes over it gets a
+MemoryError and its worker is replaced too.  Each task is timed, and
+what became of it is one of the `STATUSES`.
+"""
+import os
+import time
+from collections import deque
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+
+
+# 'ok': the task returned; 'timeout' and 'memory': it went over the time
+# or the memory budget; 'error': it raised, or its worker died.
+STATUSES = ('ok', 'timeout', 'memory', 'error')
+
+# The statuses of the tasks that did not finish within the budget
+OVER_BUDGET = ('timeout', 'memory')
+
+
+def address_space():
+    # The bytes mapped by this process, where /proc tells
+    try:
+        with open('/proc/self/statm') as fd:
+            return int(fd.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def limit_memory(memory):
+    try:
+        import resource
+    except ImportError:
+        # Not on Windows
+        return
+    used = address_space()
+    if used is None:
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (used + memory, used + memory))
+
+
+def work(conn, function, memory, initializer, initargs):
+    if memory:
+        limit_memory(memory)
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        start = time.perf_counter()
+        # Answered once the except clauses have let go of the failed
+        # task's frames, and so of its memory.
+        try:
+            status, result = 'ok', function(*task)
+        except MemoryError:
+            status, result = 'memory', None
+        except Exception as e:
+            status, result = 'error', '{0}: {1}'.format(type(e).__name__, e)
+        conn.send((status, result, time.perf_counter() - start))
+        if status != 'ok':
+            # Whatever the worker holds may be in pieces; start over.
+            return
+
+
+class Worker(object):
+    def __init__(self, function, memory, initializer, initargs):
+        self.conn, child = Pipe()
+        self.process = Process(
+            target=work,
+            args=(child, function, memory, initializer, initargs),
+            daemon=True)
+        self.process.start()
+        child.close()
+        self.task = None
+        self.start = None
+
+    def send(self, index, task):
+        self.task = index
+        self.start = time.perf_counter()
+        self.conn.send(task)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def run(function, tasks, workers, timeout=0, memory=0, initializer=None,
+        initargs=()):
+    """
+    Call `function(*task)` for each of `tasks` on `workers` processes,
+    giving each call `timeout` seconds and `memory` bytes at most (0 for
+    no limit), and return a `(status, result, seconds)` triple for each:
+    the result is the return value when the status is 'ok', and the error
+    message when it is 'error'.
+    """
+    outcomes = [None] * len(tasks)
+    pending = deque(enumerate(tasks))
+    idle = []
+    busy = {}
+    try:
+        while pending or busy:
+            while pending and len(busy) < workers:
+                worker = idle.pop() if idle else Worker(
+                    function, memory, initializer, initargs)
+                worker.send(*pending.popleft())
+                busy[worker.conn] = worker
+
+            wait_for = None
+            if timeout:
+                wait_for = max(0, min(
+                    worker.start for worker in busy.values()) +
+                    timeout - time.perf_counter())
+            for conn in wait(list(busy), wait_for):
+                worker = busy.pop(conn)
+                try:
+                    status, result, seconds = conn.recv()
+                except EOFError:
+                    worker.process.join()
+                    status, result, seconds = (
+                        'error', 'the worker process exited with code '
+                        '{0}'.format(worker.process.exitcode),
+                        time.perf_counter() - worker.start)
+                outcomes[worker.task] = (status, result, seconds)
+                if status == 'ok':
+                    idle.append(worker)
+                else:
+                    worker.kill()
+
+            if timeout:
+                now = time.perf_counter()
+                for conn, worker in list(busy.items()):
+                    if now - worker.start >= timeout:
+                        del busy[conn]
+                        worker.kill()
+                        outcomes[worker.task] = ('timeout', None,
+                                                 now - worker.start)
+    finally:
+        for worker in idle:
+            worker.stop()
+        for worker in busy.values():
+            worker.kill()
+    return outcomes
@@ -0,0 +1,101 @@
+"""
+The records `split_content` in both extensions parses directive bodies
+into.
+
+They use `__slots__`, so they carry no per-instance dict and, unlike the
+`AttrDict` they replace, do not refer to themselves, so they are freed
+by reference counting alone.  `lineno` is the 1-based source line the
+record's content starts on, when it is known.
+"""
+
+
+class Record(object):
+    __slots__ = ()
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, ', '.join(
+            '{0}={1!r}'.format(name, getattr(self, name))
+            for name in self.__slots__))
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class ExamplePart(Record):
+    """
+    The schema or one instance of a `schema_example`.  `digest` and
+    `jschon` are filled in lazily by the validator.  For a part read from
+    a file, `external` is its `ExternalFile` and `content` only the start
+    of it.
+    """
+    __slots__ = ('content', 'json', 'should_pass', 'comment', 'hl_lines',
+                 'lineno', 'digest', 'jschon', 'external')
+
+    def __init__(self, content, json, should_pass=True, comment=(),
+                 hl_lines=(), lineno=None):
+        self.content = content
+        self.json = json
+        self.should_pass = should_pass
+        self.comment = comment
+        self.hl_lines = hl_lines
+        self.lineno = lineno
+        self.digest = None
+        self.jschon = None
+        self.external = None
+
+
+class TabPart(Record):
+    """
+    One labelled tab of a `draft_specific` or `language_specific` block.
+    `offset` is the index of its first content line within the directive
+    content.
+    """
+    __slots__ = ('label', 'content', 'offset', 'lineno', 'paragraph')
+
+    def __init__(self, label, content, offset=0, lineno=None):
+        self.label = label
+        self.content = content
+        self.offset = offset
+        self.lineno = lineno
+        self.paragraph = None
+
+
+class ExampleRecord(Record):
+    """
+    One validated instance of a `schema_example`, as kept on the build
+    environment: `schema` and `content` are the schema and instance text,
+    `key` the result cache key.  `schema_path` and `path` are the files
+    the schema and the instance were read from, if any, in which case
+    the text is only the start of them.
+    """
+    __slots__ = ('docname', 'lineno', 'standard', 'key', 'schema',
+                 'content', 'should_pass', 'schema_hl_lines', 'hl_lines',
+                 'schema_path', 'path')
+
+    def __init__(self, docname, lineno, standard, key, schema, content,
+                 should_pass, schema_hl_lines=(), hl_lines=(),
+                 schema_path=None, path=None):
+        self.docname = docname
+        self.lineno = lineno
+        self.standard = standard
+        self.key = key
+        self.schema = schema
+        self.content = content
+        self.should_pass = should_pass
+        self.schema_hl_lines = schema_hl_lines
+        self.hl_lines = hl_lines
+        self.schema_path = schema_path
+        self.path = path
+
+
+def content_first_line(directive):
+    """
+    The source line of the first line of a directive's content, if any.
+    """
+    if len(directive.content):
+        return directive.content.offset(0) + 1
+    return None
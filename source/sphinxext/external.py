@@ -0,0 +1,106 @@
+"""
+Schemas and instances read from files, for the `:schema:`, `:instance:`
+and `:invalid-instance:` options of `schema_example`.
+
+Files are parsed once per build process and kept until their size or
+modification time changes.  Files of `MMAP_THRESHOLD` bytes or more are
+memory-mapped, so that they are hashed, previewed and, with a decoder
+that takes bytes such as orjson's, parsed without a copy of their text.
+Only the first lines of a file go into the doctree.
+"""
+import hashlib
+import mmap
+import os
+
+
+MMAP_THRESHOLD = 1024 * 1024
+
+
+class ExternalFile(object):
+    """
+    A parsed file: `json` is its value, or `invalid` if it is not valid
+    JSON, `sha1` the digest of its bytes and `preview` the text shown in
+    the documentation.
+    """
+    __slots__ = ('path', 'mtime', 'size', 'sha1', 'json', 'preview',
+                 'truncated')
+
+    def __init__(self, path, mtime, size, sha1, json, preview, truncated):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.sha1 = sha1
+        self.json = json
+        self.preview = preview
+        self.truncated = truncated
+
+
+def preview_of(data, lines):
+    end = -1
+    for i in range(lines):
+        end = data.find(b'\n', end + 1)
+        if end == -1:
+            return data[:].decode('utf-8').rstrip('\n'), False
+    return data[:end].decode('utf-8'), end + 1 < len(data)
+
+
+def parse(data, loads, invalid):
+    try:
+        with memoryview(data) as view:
+            try:
+                return loads(view)
+            except TypeError:
+                return loads(view.tobytes().decode('utf-8'))
+    except ValueError:
+        return invalid
+
+
+class ExternalFileCache(object):
+    def __init__(self):
+        self.files = {}
+
+    def load(self, path, loads, invalid, max_bytes, preview_lines):
+        """
+        The `ExternalFile` for `path`, parsed with `loads`.  Raises
+        ValueError if the file is missing or larger than `max_bytes`.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            raise ValueError("Cannot read {0}: {1}".format(
+                path, e.strerror))
+        # Checked first, since the file may have been cached by a call
+        # with a larger limit or none.
+        if max_bytes and stat.st_size > max_bytes:
+            raise ValueError(
+                "{0} is {1} bytes, more than jsonschema_external_max_bytes "
+                "({2})".format(path, stat.st_size, max_bytes))
+        cached = self.files.get(path)
+        if (cached is not None and cached.mtime == stat.st_mtime_ns and
+                cached.size == stat.st_size):
+            return cached
+
+        with open(path, 'rb') as fd:
+            if stat.st_size >= MMAP_THRESHOLD:
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    external = self.make(path, stat, m, loads, invalid,
+                                         preview_lines)
+            else:
+                external = self.make(path, stat, fd.read(), loads, invalid,
+                                     preview_lines)
+        self.files[path] = external
+        return external
+
+    @staticmethod
+    def make(path, stat, data, loads, invalid, preview_lines):
+        preview, truncated = preview_of(data, preview_lines)
+        return ExternalFile(
+            path, stat.st_mtime_ns, stat.st_size,
+            hashlib.sha1(data).hexdigest(), parse(data, loads, invalid),
+            preview, truncated)
+
+    def clear(self):
+        self.files.clear()
+
+
+external_files = ExternalFileCache()
@@ -0,0 +1,70 @@
+"""
+`format` assertion for `jsonschema_assert_formats`.
+
+Every engine checks formats with the same checkers, jsonschema's, through
+`conforms`, which remembers the result for each format and value, so a
+value is checked only once per process however many examples and drafts
+it appears in.  Formats jsonschema cannot check, some of which need its
+optional dependencies, are not asserted.
+"""
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def format_checker():
+    import jsonschema
+    return jsonschema.FormatChecker()
+
+
+def formats():
+    return sorted(format_checker().checkers)
+
+
+@functools.lru_cache(maxsize=4096)
+def _conforms(format, value):
+    return format_checker().conforms(value, format)
+
+
+def conforms(format, value):
+    try:
+        return _conforms(format, value)
+    except TypeError:
+        # Arrays and objects are not hashable, nor checked by any format.
+        return format_checker().conforms(value, format)
+
+
+def format_message(format, value):
+    return '{0!r} is not a {1!r}'.format(value, format)
+
+
+@functools.lru_cache(maxsize=None)
+def jsonschema_format_checker():
+    """
+    A `jsonschema.FormatChecker` that goes through `conforms`.
+    """
+    import jsonschema
+
+    class MemoizedFormatChecker(jsonschema.FormatChecker):
+        def check(self, instance, format):
+            if not conforms(format, instance):
+                raise jsonschema.FormatError(format_message(format, instance))
+
+    return MemoizedFormatChecker(formats())
+
+
+def jschon_format_validators():
+    """
+    The format validators to add to a jschon catalog.
+    """
+    def validator(format):
+        def validate(value):
+            if not conforms(format, value):
+                raise ValueError(format_message(format, value))
+        return validate
+
+    return dict((format, validator(format)) for format in formats())
+
+
+def fastjsonschema_formats():
+    return dict((format, functools.partial(conforms, format))
+                for format in formats())
@@ -0,0 +1,218 @@
+"""
+Cached syntax highlighting for literal blocks.
+
+The highlighter of every HTML and LaTeX translator is wrapped so that
+the output of Pygments is looked up by the source, the language, the
+options and highlighted lines, the output format and the style before
+anything is lexed.  The cache is kept in the doctree directory, one file
+per output format, and discarded whenever Pygments or Sphinx changes.
+It also records which outputs each document used when it was last
+written, and keeps only those of the documents still in the project.
+
+When pages are written in parallel, the worker processes append what
+they highlight and look up to files of their own, which the main process merges into
+the cache once the build is done.
+"""
+import glob
+import hashlib
+import json
+import os
+
+from docutils import nodes
+import pygments
+import sphinx
+from sphinx.util import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class HighlightCache(object):
+    def __init__(self):
+        self.path = None
+        self.versions = {'pygments': pygments.__version__,
+                         'sphinx': sphinx.__version__}
+        self.entries = {}
+        self.documents = {}
+        self.written = {}
+        self.dirty = False
+        self.pid = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, doctreedir, dest):
+        self.path = os.path.join(
+            doctreedir, 'jsonschema-highlight-{0}.json'.format(dest))
+        self.entries = {}
+        self.documents = {}
+        self.written = {}
+        self.dirty = False
+        self.pid = os.getpid()
+        try:
+            with open(self.path, encoding='utf-8') as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            return
+        if data.get('versions') == self.versions:
+            self.entries = data.get('entries', {})
+            self.documents = data.get('documents', {})
+
+    def get(self, document, key):
+        try:
+            output = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.use(document, key, None)
+        return output
+
+    def add(self, document, key, output):
+        self.entries[key] = output
+        self.use(document, key, output)
+
+    def use(self, document, key=None, output=None):
+        # What `document` used this build: nothing yet when `key` is None,
+        # and a key that was looked up rather than added when `output` is.
+        if os.getpid() == self.pid:
+            keys = self.written.setdefault(document, set())
+            if key is not None:
+                keys.add(key)
+            if output is not None:
+                self.dirty = True
+            return
+        # In a parallel writer process, which does not report back
+        with open('{0}.{1}'.format(self.path, os.getpid()), 'a',
+                  encoding='utf-8') as fd:
+            fd.write(json.dumps([document, key, output]) + '\n')
+
+    def merge(self):
+        for shard in glob.glob(glob.escape(self.path) + '.*'):
+            try:
+                with open(shard, encoding='utf-8') as fd:
+                    for line in fd:
+                        document, key, output = json.loads(line)
+                        keys = self.written.setdefault(document, set())
+                        if key is not None:
+                            keys.add(key)
+                        if output is not None:
+                            self.entries[key] = output
+                            self.dirty = True
+            except (OSError, ValueError):
+                pass
+            os.unlink(shard)
+
+    def prune(self, docnames):
+        """
+        Record what the documents written this build used, forget the
+        documents no longer among `docnames`, then the entries that none
+        of the remaining documents use.
+        """
+        documents = dict(
+            (document, keys) for document, keys in self.documents.items()
+            if document in docnames and document not in self.written)
+        for document, keys in self.written.items():
+            documents[document] = sorted(keys)
+        self.written = {}
+        used = set(key for keys in documents.values() for key in keys)
+        entries = dict((key, output) for key, output in self.entries.items()
+                       if key in used)
+        if documents != self.documents or len(entries) != len(self.entries):
+            self.dirty = True
+        self.documents = documents
+        self.entries = entries
+
+    def save(self, docnames=None):
+        if self.path is None:
+            return
+        self.merge()
+        if docnames is not None:
+            self.prune(docnames)
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as fd:
+            json.dump({'versions': self.versions, 'entries': self.entries,
+                       'documents': self.documents}, fd, sort_keys=True)
+        self.dirty = False
+
+
+highlight_cache = HighlightCache()
+
+
+class CachingHighlighter(object):
+    """
+    Wraps a `sphinx.highlighting.PygmentsBridge`.
+    """
+
+    def __init__(self, highlighter, cache, style, document=''):
+        self.highlighter = highlighter
+        self.cache = cache
+        self.style = style
+        self.document = document
+
+    def __getattr__(self, name):
+        return getattr(self.highlighter, name)
+
+    def highlight_block(self, source, lang, opts=None, location=None,
+                        **kwargs):
+        key = hashlib.sha1(json.dumps(
+            [self.highlighter.dest, self.style, source, lang, opts or {},
+             kwargs], sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        output = self.cache.get(self.document, key)
+        if output is None:
+            output = self.highlighter.highlight_block(
+                source, lang, opts=opts, location=location, **kwargs)
+            self.cache.add(self.document, key, output)
+        return output
+
+
+def init_highlight_cache(app):
+    if app.builder.format not in ('html', 'latex'):
+        return
+    highlight_cache.load(app.doctreedir, app.builder.format)
+
+    style = str(app.config.pygments_style)
+    create_translator = app.builder.create_translator
+
+    def create_caching_translator(*args):
+        translator = create_translator(*args)
+        highlighter = getattr(translator, 'highlighter', None)
+        if highlighter is not None and not isinstance(
+                highlighter, CachingHighlighter):
+            document = translated_docname(app.builder, args)
+            highlight_cache.use(document)
+            translator.highlighter = CachingHighlighter(
+                highlighter, highlight_cache, style, document)
+        return translator
+
+    app.builder.create_translator = create_caching_translator
+
+
+def translated_docname(builder, args):
+    # The HTML builders set `current_docname` before translating each
+    # page; the LaTeX documents are named after their start document.
+    docname = getattr(builder, 'current_docname', None)
+    if docname is None:
+        for arg in args:
+            if isinstance(arg, nodes.document):
+                docname = arg.get('docname')
+    return docname or ''
+
+
+def save_highlight_cache(app, exception):
+    # After a failed build, the documents it did not get to are kept.
+    highlight_cache.save(None if exception else app.env.found_docs)
+    logger.verbose("highlight cache: %d hits, %d misses",
+                   highlight_cache.hits, highlight_cache.misses)
+
+
+def setup(app):
+    app.connect('builder-inited', init_highlight_cache)
+    app.connect('build-finished', save_highlight_cache)
+
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -1,69 +1,600 @@
+import argparse
+import ast
+import hashlib
+import importlib.util
 import json
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import PackageNotFoundError
+from importlib.metadata import version as distribution_version
 
 from docutils import nodes
 from docutils import statemachine
-from docutils.parsers.rst import Directive
+from docutils.parsers.rst import Directive, directives
+from sphinx.builders import Builder
+from sphinx.errors import ConfigError, SphinxError
+from sphinx.util import import_object, logging
 from sphinx.util.nodes import set_source_info
 
-import jsonschema
-from jschon import create_catalog, JSON, JSONSchema, URI
+from . import budget
+from .example import ExamplePart, ExampleRecord, content_first_line
+from .external import external_files
+from .formats import (fastjsonschema_formats, jschon_format_validators,
+                      jsonschema_format_checker)
+from .profile import profiler
+from .registry import load_schemas, schema_registry
+from .shortcircuit import short_circuit
 
 
+logger = logging.getLogger(__name__)
+
+
+def default_json_decoder():
+    try:
+        import orjson
+    except ImportError:
+        return json.loads
+    return orjson.loads
+
+
+# Used to parse every example.  Any callable taking a string and raising
+# ValueError on invalid input will do; see jsonschema_json_decoder.
+json_loads = default_json_decoder()
+
+# Stands in for the value of an instance that is not valid JSON.
+INVALID_JSON = object()
+
+
+# The jsonschema validator classes for the drafts before 2019-09, by
+# name: jsonschema and jschon are only imported once an example needs
+# them, so builds that validate nothing never load them.
 legacy = {
-    'http://json-schema.org/draft-03/schema#': jsonschema.validators.Draft3Validator,
-    'http://json-schema.org/draft-04/schema#': jsonschema.validators.Draft4Validator,
-    'http://json-schema.org/draft-06/schema#': jsonschema.validators.Draft6Validator,
-    'http://json-schema.org/draft-07/schema#': jsonschema.validators.Draft7Validator
+    'http://json-schema.org/draft-03/schema#': 'Draft3Validator',
+    'http://json-schema.org/draft-04/schema#': 'Draft4Validator',
+    'http://json-schema.org/draft-06/schema#': 'Draft6Validator',
+    'http://json-schema.org/draft-07/schema#': 'Draft7Validator'
 }
 
-def validate(schema, part, standard):
-    if standard in legacy:
-        cls = legacy[standard]
+# Every draft `validate` supports, oldest first
+DRAFTS = list(legacy) + [
+    'https://json-schema.org/draft/2019-09/schema',
+    'https://json-schema.org/draft/2020-12/schema',
+]
+
+
+def schema_key(standard, schema):
+    if schema.digest is None:
+        canonical = json.dumps(
+            schema.json, sort_keys=True, separators=(',', ':'))
+        schema.digest = hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+    return (standard, schema.digest)
+
+
+def jschon_value(part):
+    # Built from the already parsed value rather than from the text, and
+    # only once the jschon engine actually needs it.
+    if part.jschon is None:
+        from jschon import JSON
+        part.jschon = JSON(part.json)
+    return part.jschon
+
+
+class Backend(object):
+    """
+    A validation engine.  `compile` returns a validator for a schema,
+    raising ValueError if the schema is invalid, and `evaluate` returns
+    `(is_valid, message)` for an instance.  An engine whose `evaluate`
+    only tells whether an instance is valid also has `explain` return
+    the message for an instance that is not.
+    """
+    name = None
+    available = True
+
+    def supports(self, standard):
+        raise NotImplementedError
+
+    def compile(self, schema, standard):
+        raise NotImplementedError
+
+    def evaluate(self, validator, part):
+        raise NotImplementedError
 
+    def explain(self, validator, part):
+        return None
+
+    def release(self, validator):
+        pass
+
+
+# The message of a failure `explain` has not been asked about
+UNEXPLAINED = 'VALIDATION ERROR'
+
+
+def unexplained(result, should_pass):
+    """
+    Whether `result` is a failure that would be reported without its
+    details, as when it was cached for an instance that should fail.
+    """
+    return should_pass and result[0] is False and result[1] == UNEXPLAINED
+
+
+def invalid_schema(message, schema):
+    return ValueError("Schema is invalid:\n{0}\n\n{1}".format(
+        message, schema.content))
+
+
+class JsonschemaBackend(Backend):
+    name = 'jsonschema'
+
+    def validator_class(self, standard):
+        import jsonschema
+        if standard in legacy:
+            return getattr(jsonschema.validators, legacy[standard])
+        return jsonschema.validators.validator_for(
+            {'$schema': standard}, default=None)
+
+    def supports(self, standard):
+        return self.validator_class(standard) is not None
+
+    def compile(self, schema, standard):
+        import jsonschema
+        cls = self.validator_class(standard)
         try:
-            jsonschema.validate(part.json, schema.json, cls=cls)
+            with profiler.phase('metaschema'):
+                cls.check_schema(schema.json)
+        except jsonschema.SchemaError as e:
+            raise invalid_schema(str(e), schema)
+        options = schema_registry.jsonschema_options(cls, schema.json)
+        if assert_formats:
+            options['format_checker'] = jsonschema_format_checker()
+        with profiler.phase('compile'):
+            return cls(schema.json, **options)
+
+    def evaluate(self, validator, part):
+        import jsonschema
+        try:
+            error = jsonschema.exceptions.best_match(
+                validator.iter_errors(part.json))
+        except reference_errors() as e:
+            raise ValueError("Unresolvable reference: {0}".format(e))
+        if error is None:
             return (True, '')
-        except jsonschema.ValidationError as e:
-            return (False, str(e))
+        return (False, str(error))
+
+
+def reference_errors():
+    try:
+        from referencing.exceptions import Unresolvable
+    except ImportError:
+        # jsonschema before 4.18
+        from jsonschema import RefResolutionError
+        return (RefResolutionError,)
+    return (Unresolvable,)
+
+
+class JschonBackend(Backend):
+    name = 'jschon'
+
+    def __init__(self):
+        self._catalog = None
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            self._catalog = schema_registry.jschon_catalog(
+                '2019-09', '2020-12')
+            if assert_formats:
+                self._catalog.add_format_validators(
+                    jschon_format_validators())
+        return self._catalog
+
+    def supports(self, standard):
+        return standard not in legacy
+
+    def compile(self, schema, standard):
+        from jschon import (CatalogError, JSONPointerError, JSONSchema,
+                            JSONSchemaError, URI, URIError)
+        # Each schema in a session of its own, so that the $id of one
+        # example never resolves the $ref of another.
+        session = schema_key(standard, schema)
+        try:
+            try:
+                with profiler.phase('compile'):
+                    compiled_schema = JSONSchema(
+                        schema.json, catalog=self.catalog, session=session,
+                        metaschema_uri=URI(standard))
+            except CatalogError as e:
+                raise ValueError("Unresolvable reference: {0}".format(e))
+            except (JSONSchemaError, JSONPointerError, URIError,
+                    re.error) as e:
+                # Such as a `pattern` that is not a regular expression
+                raise invalid_schema(
+                    '{0}: {1}'.format(type(e).__name__, e), schema)
+            with profiler.phase('metaschema'):
+                valid_schema = compiled_schema.validate().valid
+            if not valid_schema:
+                raise invalid_schema("INVALID SCHEMA", schema)
+        except ValueError:
+            self.drop_session(session)
+            raise
+        return compiled_schema
+
+    def release(self, validator):
+        self.drop_session(validator.session)
+
+    def drop_session(self, session):
+        # What `Catalog.session()` does on exit
+        if self._catalog is not None:
+            self._catalog._schema_cache.pop(session, None)
+
+    def evaluate(self, validator, part):
+        with short_circuit():
+            validation_result = validator.evaluate(jschon_value(part))
+
+        if validation_result.valid:
+            return (True, '');
+        else:
+            return (False, UNEXPLAINED);
+
+    def explain(self, validator, part):
+        output = validator.evaluate(jschon_value(part)).output('basic')
+        return '\n'.join(
+            '{0}: {1} (at {2})'.format(
+                error['instanceLocation'] or '/', error['error'],
+                error['keywordLocation'] or '/')
+            for error in output.get('errors', ()))
+
+
+class FastjsonschemaBackend(Backend):
+    """
+    Compiles each schema to Python code with fastjsonschema, for the
+    drafts it implements.  It does not check schemas against their
+    metaschema, so jsonschema does that instead.
+    """
+    name = 'fastjsonschema'
+    standards = (
+        'http://json-schema.org/draft-04/schema#',
+        'http://json-schema.org/draft-06/schema#',
+        'http://json-schema.org/draft-07/schema#',
+    )
+
+    def __init__(self):
+        self.available = importlib.util.find_spec('fastjsonschema') is not None
+
+    def supports(self, standard):
+        return self.available and standard in self.standards
+
+    def compile(self, schema, standard):
+        import fastjsonschema
+        import jsonschema
+        try:
+            with profiler.phase('metaschema'):
+                backends['jsonschema'].validator_class(standard).check_schema(
+                    schema.json)
         except jsonschema.SchemaError as e:
-            raise ValueError("Schema is invalid:\n{0}\n\n{1}".format(
-                str(e), schema.content))
+            raise invalid_schema(str(e), schema)
+        definition = schema.json
+        if isinstance(definition, dict):
+            definition = dict(definition, **{'$schema': standard})
+        try:
+            with profiler.phase('compile'):
+                return fastjsonschema.compile(
+                    definition, use_default=False, use_formats=assert_formats,
+                    formats=fastjsonschema_formats() if assert_formats else {},
+                    handlers={'http': schema_registry.lookup,
+                              'https': schema_registry.lookup})
+        except LookupError as e:
+            raise ValueError("Unresolvable reference: {0}".format(e))
+        except (fastjsonschema.JsonSchemaDefinitionException, re.error) as e:
+            raise invalid_schema(
+                '{0}: {1}'.format(type(e).__name__, e), schema)
 
-        return (is_valid, message)
-    else:
-        catalogue = create_catalog('2019-09', '2020-12')
+    def evaluate(self, validator, part):
+        import fastjsonschema
+        try:
+            validator(part.json)
+        except fastjsonschema.JsonSchemaValueException as e:
+            return (False, e.message)
+        return (True, '')
+
+
+backends = dict((backend.name, backend) for backend in (
+    JsonschemaBackend(), JschonBackend(), FastjsonschemaBackend()))
+
+# The backend used wherever it supports the standard; the others fall
+# back to jsonschema for the legacy drafts and jschon for the rest.
+# Set from jsonschema_validator_backend.
+validator_backend = 'default'
+
+# Whether `format` is asserted rather than only annotated.  Set from
+# jsonschema_assert_formats.
+assert_formats = False
+
+
+def select_backend(name):
+    global validator_backend
+    if name != 'default' and name not in backends:
+        raise ValueError("Unknown validator backend {0!r}; expected one of "
+                         "{1}".format(name, ', '.join(
+                             ['default'] + sorted(backends))))
+    validator_backend = name
+
+
+def set_schemas(schemas):
+    """
+    Replace the schemas in the registry, dropping everything compiled
+    against the previous ones.
+    """
+    schema_registry.set(schemas)
+    backends['jschon']._catalog = None
+    validator_cache.clear()
 
-        compiled_schema = JSONSchema(schema.json, metaschema_uri=URI(standard))
-        if not compiled_schema.validate().valid:
-            raise ValueError("Schema is invalid:\n{0}\n\n{1}".format(
-                "INVALID SCHEMA", schema.content))
-        elif part.json == (1+1j):
+
+def set_assert_formats(value):
+    global assert_formats
+    if value != assert_formats:
+        assert_formats = value
+        backends['jschon']._catalog = None
+        validator_cache.clear()
+
+
+def init_worker(backend, schemas, formats=False):
+    select_backend(backend)
+    set_schemas(schemas)
+    set_assert_formats(formats)
+
+
+def worker_state():
+    # The `init_worker` arguments that set a worker up like this process
+    return (validator_backend, schema_registry.schemas, assert_formats)
+
+
+def backend_for(standard):
+    backend = backends.get(validator_backend)
+    if backend is None or not backend.supports(standard):
+        backend = backends['jsonschema' if standard in legacy else 'jschon']
+    return backend
+
+
+class ValidatorCache(object):
+    """
+    Compiled validators, keyed by (backend, standard, canonical schema
+    hash), so that each schema is compiled and checked against its
+    metaschema only once per process.  The least recently used entries
+    are evicted, and released by their backend, once there are more than
+    `maxsize` of them.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._validators = OrderedDict()
+
+    def get(self, backend, schema, standard):
+        key = (backend.name,) + schema_key(standard, schema)
+        try:
+            validator = self._validators[key]
+        except KeyError:
+            self.misses += 1
+            validator = backend.compile(schema, standard)
+            self._validators[key] = validator
+            if len(self._validators) > self.maxsize:
+                (name, _, _), evicted = self._validators.popitem(last=False)
+                backends[name].release(evicted)
+        else:
+            self.hits += 1
+            self._validators.move_to_end(key)
+        return validator
+
+    def clear(self):
+        for (name, _, _), validator in self._validators.items():
+            backends[name].release(validator)
+        self._validators.clear()
+        self.hits = self.misses = 0
+
+
+validator_cache = ValidatorCache()
+
+
+def validate(schema, part, standard):
+    backend = backend_for(standard)
+    with profiler.validation(backend.name):
+        validator = validator_cache.get(backend, schema, standard)
+
+        if part.json is INVALID_JSON:
             return (False, 'INVALID JSON')
+        with profiler.phase('evaluate'):
+            is_valid, message = backend.evaluate(validator, part)
+            # The details of a failure are only ever shown for instances
+            # that should have passed.
+            if not is_valid and part.should_pass:
+                message = backend.explain(validator, part) or message
+        return is_valid, message
+
+
+class ResultCache(object):
+    """
+    Validation results persisted across builds in the doctree directory.
+
+    Results are keyed by the backend, the standard, the schema registry
+    and the exact schema and instance text, and the whole cache is discarded whenever the
+    installed version of any validation engine changes.  Only the results
+    of the examples in the last build are kept.
+    """
+    filename = 'jsonschema-results.json'
+
+    def __init__(self):
+        self.path = None
+        self.versions = {}
+        for name in backends:
+            try:
+                self.versions[name] = distribution_version(name)
+            except PackageNotFoundError:
+                pass
+        self.results = {}
+        self.dirty = False
+
+    @staticmethod
+    def key(schema, part, standard):
+        return ResultCache.text_key(
+            standard, source_text(schema), source_text(part))
+
+    @staticmethod
+    def text_key(standard, schema_text, part_text):
+        digest = hashlib.sha1()
+        for text in (backend_for(standard).name, standard,
+                     schema_registry.digest, schema_text, part_text):
+            digest.update(text.encode('utf-8'))
+            digest.update(b'\0')
+        if assert_formats:
+            digest.update(b'formats\0')
+        return digest.hexdigest()
+
+    def load(self, doctreedir):
+        self.path = os.path.join(doctreedir, self.filename)
+        self.results = {}
+        self.dirty = False
+        try:
+            with open(self.path, encoding='utf-8') as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            return
+        if data.get('versions') == self.versions:
+            self.results = data.get('results', {})
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as fd:
+            json.dump({'versions': self.versions, 'results': self.results},
+                      fd, sort_keys=True)
+        self.dirty = False
+
+    def update(self, results):
+        if results:
+            self.results.update(results)
+            self.dirty = True
+
+    def prune(self, keys):
+        # Forget the results of the examples that have changed or gone
+        stale = [key for key in self.results if key not in keys]
+        for key in stale:
+            del self.results[key]
+        if stale:
+            self.dirty = True
+
+    def validate(self, env, schema, part, standard):
+        # New results are also recorded on the environment, since with
+        # parallel reading they are produced in a worker process and only
+        # the environment is merged back into the main one.
+        key = self.key(schema, part, standard)
+        result = self.results.get(key)
+        if result is not None and not unexplained(result, part.should_pass):
+            is_valid, message = result
         else:
-            jsonValue = JSON.loads(part.content)
-            validation_result = compiled_schema.evaluate(jsonValue)
+            is_valid, message = validate(schema, part, standard)
+            self.results[key] = env.jsonschema_new_results[key] = [
+                is_valid, message]
+        return is_valid, message
 
-            if validation_result.valid:
-                return (True, '');
-            else:
-                return (False, 'VALIDATION ERROR');
+
+result_cache = ResultCache()
 
 
 class jsonschema_node(nodes.Element):
     pass
 
 
-class AttrDict(dict):
-    def __init__(self, *args, **kwargs):
-        super(AttrDict, self).__init__(*args, **kwargs)
-        self.__dict__ = self
+def failure_record(docname, source, lineno, standard, should_pass,
+                   is_valid, message, content):
+    """
+    A failed example, as listed in the keep-going report.  `is_valid` is
+    `None` when the example could not be validated at all.
+    """
+    return {
+        'document': docname,
+        'source': source,
+        'line': lineno,
+        'draft': standard,
+        'engine': backend_for(standard).name,
+        'expected': 'pass' if should_pass else 'fail',
+        'actual': (None if is_valid is None else
+                   'pass' if is_valid else 'fail'),
+        'message': message,
+        'content': content,
+    }
 
 
-def split_content(l):
-    parts = []
+def failure_message(failure):
+    if failure['actual'] is None:
+        return failure['message']
+    return mismatch_message(failure['expected'] == 'pass',
+                            failure['content'], failure['message'])
+
+
+def mismatch_message(should_pass, content, message):
+    if should_pass:
+        return ("Doc says fragment should pass, "
+                "but it does not validate:\n" +
+                content + "\n" +
+                message)
+    else:
+        return ("Doc says fragment should not pass, "
+                "but it validates:\n" +
+                content)
+
+
+def load_json(content):
+    try:
+        return json_loads(content)
+    except ValueError:
+        return INVALID_JSON
+
+
+def source_text(part):
+    """
+    What identifies the content of `part`: its text, or the digest of the
+    file it was read from.
+    """
+    if part.external is not None:
+        return 'file:' + part.external.sha1
+    return part.content
+
+
+def load_external(path, should_pass=True, max_bytes=0, preview_lines=50):
+    """
+    The `ExamplePart` for the JSON file at `path`, showing its first
+    `preview_lines` lines.
+    """
+    external = external_files.load(path, json_loads, INVALID_JSON,
+                                   max_bytes, preview_lines)
+    if external.json is INVALID_JSON and should_pass:
+        raise ValueError("Invalid json: {0}".format(path))
+    content = external.preview
+    if external.truncated:
+        content += '\n// ... {0} bytes in all'.format(external.size)
+    part = ExamplePart(content, external.json, should_pass)
+    part.external = external
+    return part
+
+
+def split_content(l, first_line=None, schema=None, strict=True):
+    """
+    Split the body of a `schema_example` into the schema and the
+    instances.  If the `schema` part is given, the whole body is
+    instances.  Unless `strict`, instances that should pass but are not
+    valid JSON are kept, to fail validation, rather than raising.
+    """
+    parts = [] if schema is None else [schema]
     should_pass = True
     part = []
     comment = []
+    offset = 0
 
     def add_part():
         hl_lines = []
@@ -74,49 +605,92 @@ def split_content(l):
                 part[i] = line
 
         content = '\n'.join(part)
-        try:
-            json_content = json.loads(content)
-        except ValueError:
-            if should_pass:
-                raise ValueError("Invalid json: {0}".format(content))
-            else:
-                # A complex number will never validate
-                json_content = 1+1j
-        parts.append(AttrDict({
-            'should_pass': should_pass,
-            'content': content,
-            'json': json_content,
-            'comment': comment,
-            'hl_lines': hl_lines}
-        ))
-
-    for line in l:
+        json_content = load_json(content)
+        if json_content is INVALID_JSON and should_pass and (
+                strict or not parts):
+            error = ValueError("Invalid json: {0}".format(content))
+            error.lineno = (
+                None if first_line is None else first_line + offset)
+            raise error
+        parts.append(ExamplePart(
+            content, json_content, should_pass, comment, hl_lines,
+            None if first_line is None else first_line + offset))
+
+    for i, line in enumerate(l):
         if line.startswith('//'):
             comment.append(line[2:].lstrip())
         elif line == '--':
-            add_part()
+            if schema is None or part:
+                add_part()
             should_pass = True
             part = []
             comment = []
+            offset = i + 1
         elif line == '--X':
-            add_part()
+            if schema is None or part:
+                add_part()
             should_pass = False
             part = []
             comment = []
+            offset = i + 1
         else:
             part.append(line)
 
-    add_part()
+    if schema is None or part:
+        add_part()
 
     return parts[0], parts[1:]
 
 
+def highlight_language(env, part):
+    # The json lexer rejects anything but JSON, such as the instances
+    # that are not valid JSON on purpose or the previews of large files.
+    language = env.config.jsonschema_highlight_language
+    if language == 'json' and (
+            part.json is INVALID_JSON or
+            (part.external is not None and part.external.truncated)):
+        return 'javascript'
+    return language
+
+
+def split_example(content, first_line, options, load, strict=True):
+    """
+    Like `split_content`, but also reading the files named by the
+    `schema`, `instance` and `invalid-instance` directive `options` with
+    `load(filename, should_pass)`.
+    """
+    schema = options.get('schema')
+    if schema is not None:
+        schema = load(schema)
+    schema, parts = split_content(content, first_line, schema, strict)
+    for filename in options.get('instance', '').split():
+        if strict:
+            parts.append(load(filename))
+        else:
+            # Loaded as an invalid instance, which may be invalid JSON
+            part = load(filename, False)
+            part.should_pass = True
+            parts.append(part)
+    for filename in options.get('invalid-instance', '').split():
+        parts.append(load(filename, False))
+    return schema, parts
+
+
 class SchemaExampleDirective(Directive):
     has_content = True
     validate = True
     optional_arguments = 1
+    option_spec = {
+        'schema': directives.unchanged_required,
+        'instance': directives.unchanged_required,
+        'invalid-instance': directives.unchanged_required,
+    }
 
     def run(self):
+        with profiler.directive(self, self.name):
+            return self.make_nodes()
+
+    def make_nodes(self):
         env = self.state.document.settings.env
         if len(self.arguments) == 1:
             standard = self.arguments[0]
@@ -124,15 +698,24 @@ class SchemaExampleDirective(Directive):
             standard = env.config.jsonschema_standard
 
         result = []
+        keep_going = self.validate and env.config.jsonschema_keep_going
 
-        schema, parts = split_content(self.content)
+        try:
+            schema, parts = self.split_content(strict=not keep_going)
+        except ValueError as e:
+            if not keep_going:
+                raise
+            self.add_failure(standard, True, None, str(e),
+                             '\n'.join(self.content),
+                             getattr(e, 'lineno', None))
+            return []
 
         container = jsonschema_node()
         set_source_info(self, container)
 
         literal = nodes.literal_block(
             schema.content, schema.content)
-        literal['language'] = 'javascript'
+        literal['language'] = highlight_language(env, schema)
         literal['classes'] = container['classes'] = ['jsonschema']
         if schema.hl_lines:
             literal['highlight_args'] = {'hl_lines': schema.hl_lines}
@@ -140,22 +723,46 @@ class SchemaExampleDirective(Directive):
         container.append(literal)
         result.append(container)
 
+        deferred = deferred_validation(env.config)
+
         for part in parts:
+            key = None
             if self.validate:
-                is_valid, message = validate(schema, part, standard)
+                record = ExampleRecord(
+                    env.docname, part.lineno or self.lineno, standard,
+                    result_cache.key(schema, part, standard),
+                    schema.content, part.content, part.should_pass,
+                    schema.hl_lines, part.hl_lines,
+                    schema.external and schema.external.path,
+                    part.external and part.external.path)
+                env.jsonschema_examples.setdefault(env.docname, []).append(
+                    record)
+
+            if self.validate and deferred:
+                # Validated in a batch once all documents have been read;
+                # the classes are filled in when the doctree is resolved.
+                key = record.key
+                is_valid = part.should_pass
+            elif keep_going:
+                try:
+                    is_valid, message = result_cache.validate(
+                        env, schema, part, standard)
+                except ValueError as e:
+                    self.add_failure(standard, part.should_pass, None,
+                                     str(e), part.content, part.lineno)
+                    is_valid = part.should_pass
+                else:
+                    if is_valid != part.should_pass:
+                        self.add_failure(standard, part.should_pass,
+                                         is_valid, message, part.content,
+                                         part.lineno)
+            elif self.validate:
+                is_valid, message = result_cache.validate(
+                    env, schema, part, standard)
 
                 if is_valid != part.should_pass:
-                    if part.should_pass:
-                        raise ValueError(
-                            "Doc says fragment should pass, "
-                            "but it does not validate:\n" +
-                            part.content + "\n" +
-                            message)
-                    else:
-                        raise ValueError(
-                            "Doc says fragment should not pass, "
-                            "but it validates:\n" +
-                            part.content)
+                    raise ValueError(mismatch_message(
+                        part.should_pass, part.content, message))
             else:
                 is_valid = part.should_pass
 
@@ -172,24 +779,139 @@ class SchemaExampleDirective(Directive):
             set_source_info(self, container)
             literal = nodes.literal_block(
                 part.content, part.content)
-            literal['language'] = 'javascript'
+            literal['language'] = highlight_language(env, part)
             if is_valid:
                 literal['classes'] = container['classes'] = ['jsonschema-pass']
             else:
                 literal['classes'] = container['classes'] = ['jsonschema-fail']
             if part.hl_lines:
                 literal['highlight_args'] = {'hl_lines': part.hl_lines}
+            if key is not None:
+                container['jsonschema_key'] = key
+            if self.validate:
+                container['jsonschema_example'] = record.key
+                container['jsonschema_should_pass'] = part.should_pass
             set_source_info(self, literal)
             container.append(literal)
             result.append(container)
 
         return result
 
+    def split_content(self, strict=True):
+        return split_example(self.content, content_first_line(self),
+                             self.options, self.load_external, strict)
+
+    def load_external(self, filename, should_pass=True):
+        # Relative to the document, or to the source directory if it
+        # starts with a slash, like the paths of `literalinclude`.
+        env = self.state.document.settings.env
+        relpath, path = env.relfn2path(filename, env.docname)
+        env.note_dependency(relpath)
+        return load_external(
+            path, should_pass, env.config.jsonschema_external_max_bytes,
+            env.config.jsonschema_external_preview_lines)
+
+    def add_failure(self, standard, should_pass, is_valid, message, content,
+                    lineno):
+        env = self.state.document.settings.env
+        env.jsonschema_failures.setdefault(env.docname, []).append(
+            failure_record(env.docname, env.doc2path(env.docname),
+                           lineno or self.lineno, standard, should_pass,
+                           is_valid, message, content))
+
 
 class SchemaExampleNoValidationDirective(SchemaExampleDirective):
     validate = False
 
 
+def validate_text(standard, schema_content, part_content,
+                  schema_path=None, part_path=None, should_pass=True):
+    """
+    Like `validate`, but from the text of the schema and the instance, or
+    the files they are in, and returning `(None, message)` if the schema
+    is invalid.
+    """
+    try:
+        if schema_path is not None:
+            schema = load_external(schema_path)
+        else:
+            schema = ExamplePart(schema_content, json_loads(schema_content))
+        if part_path is not None:
+            part = load_external(part_path, False)
+        else:
+            part = ExamplePart(part_content, load_json(part_content))
+        part.should_pass = should_pass
+        return validate(schema, part, standard)
+    except ValueError as e:
+        return (None, str(e))
+
+
+def validate_batch(examples, workers):
+    """
+    Validate `(standard, schema_content, part_content, schema_path,
+    part_path, should_pass)` tuples, on a process pool of `workers`
+    processes when there is more than one.  The items after the
+    instance may be left out.  `workers` of 0
+    means one per CPU.
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(examples))
+    if workers <= 1:
+        return [validate_text(*example) for example in examples]
+
+    # Hand each worker runs of the same schema, so that it compiles as
+    # few schemas as possible.
+    chunksize = max(1, len(examples) // (workers * 4))
+    with ProcessPoolExecutor(
+            workers, initializer=init_worker,
+            initargs=worker_state()) as executor:
+        return list(executor.map(
+            validate_text, *zip(*examples), chunksize=chunksize))
+
+
+def validate_budgeted(examples, workers, timeout, memory):
+    """
+    Like `validate_batch`, but each validation in a worker process that
+    is stopped once it takes more than `timeout` seconds or `memory`
+    bytes, returning `(status, result, seconds)` triples as `budget.run`
+    does.
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+    return budget.run(
+        validate_text, examples, min(workers, len(examples)), timeout,
+        memory, initializer=init_worker, initargs=worker_state())
+
+
+def validation_budget(config):
+    """
+    The `(timeout, memory)` budget of each validation, in seconds and
+    bytes, or None if there is none.
+    """
+    timeout = config.jsonschema_validation_timeout or 0
+    memory = (config.jsonschema_validation_memory or 0) * 1024 * 1024
+    if not timeout and not memory:
+        return None
+    return (timeout, memory)
+
+
+def deferred_validation(config):
+    # Validations under a budget are done in the deferred batch, whose
+    # worker processes can be stopped.
+    return bool(config.jsonschema_deferred_validation or
+                validation_budget(config))
+
+
+def over_budget_message(status, message, timeout, memory):
+    if status == 'timeout':
+        return "Validation stopped after {0} seconds".format(timeout)
+    if status == 'memory':
+        return "Validation stopped after using {0} MiB".format(
+            memory // 1024 // 1024)
+    return "Validation crashed: {0}".format(message)
+
+
 def visit_jsonschema_node_html(self, node):
     pass
 
@@ -231,19 +953,622 @@ def depart_jsonschema_node_latex(self, node):
         self.body.append(r"\end{adjustwidth}")
 
 
+def init_backend(app):
+    try:
+        select_backend(app.config.jsonschema_validator_backend)
+    except ValueError as e:
+        raise ConfigError(str(e))
+    set_assert_formats(bool(app.config.jsonschema_assert_formats))
+    backend = backends.get(validator_backend)
+    if backend is not None and not backend.available:
+        logger.warning("jsonschema_validator_backend %r is not available; "
+                       "using the default backends", validator_backend)
+
+
+def init_json_decoder(app):
+    global json_loads
+    if app.config.jsonschema_json_decoder:
+        json_loads = import_object(app.config.jsonschema_json_decoder,
+                                   'jsonschema_json_decoder')
+    else:
+        json_loads = default_json_decoder()
+
+
+def init_schema_registry(app):
+    schemas = {}
+    if app.config.jsonschema_schema_dir:
+        directory = os.path.join(app.confdir, app.config.jsonschema_schema_dir)
+        try:
+            schemas = load_schemas(directory)
+        except (OSError, ValueError) as e:
+            raise ConfigError("jsonschema_schema_dir: {0}".format(e))
+    set_schemas(schemas)
+
+
+def outdated_by_schemas(app, builder, added, changed, removed):
+    # Every example may refer to the registry, so when it changes they
+    # are all validated again.  Sphinx passes the builder, not the
+    # environment, to this event.
+    env = app.env
+    if getattr(env, 'jsonschema_schemas', None) == schema_registry.digest:
+        return []
+    env.jsonschema_schemas = schema_registry.digest
+    env.jsonschema_results = {}
+    env.jsonschema_matrix = {}
+    return sorted(getattr(env, 'jsonschema_examples', {}))
+
+
+def load_result_cache(app):
+    result_cache.load(app.doctreedir)
+
+
+def init_new_results(app, env, docnames):
+    env.jsonschema_new_results = {}
+
+
+def merge_new_results(app, env, docnames, other):
+    env.jsonschema_new_results.update(other.jsonschema_new_results)
+
+
+def init_examples(app, env, docnames):
+    if not hasattr(env, 'jsonschema_examples'):
+        env.jsonschema_examples = {}
+        env.jsonschema_results = {}
+        env.jsonschema_failures = {}
+        env.jsonschema_deferred_failures = []
+        env.jsonschema_over_budget = {}
+        env.jsonschema_timings = {}
+
+
+def purge_examples(app, env, docname):
+    if hasattr(env, 'jsonschema_examples'):
+        env.jsonschema_examples.pop(docname, None)
+        env.jsonschema_failures.pop(docname, None)
+
+
+def merge_examples(app, env, docnames, other):
+    for docname in docnames:
+        if docname in other.jsonschema_examples:
+            env.jsonschema_examples[docname] = \
+                other.jsonschema_examples[docname]
+        if docname in other.jsonschema_failures:
+            env.jsonschema_failures[docname] = \
+                other.jsonschema_failures[docname]
+
+
+def report_failures(app, exception):
+    if exception is not None:
+        return
+    env = app.env
+    # Failures recorded with jsonschema_keep_going stay on the environment
+    # until their documents change, so they fail every build sharing it,
+    # whether or not it keeps going itself.
+    failures = sorted(
+        [failure
+         for doc_failures in getattr(env, 'jsonschema_failures', {}).values()
+         for failure in doc_failures] +
+        getattr(env, 'jsonschema_deferred_failures', []),
+        key=lambda failure: (failure['document'], failure['line']))
+    if not failures and not app.config.jsonschema_keep_going:
+        return
+
+    os.makedirs(app.outdir, exist_ok=True)
+    path = os.path.join(app.outdir, 'jsonschema-failures.json')
+    with open(path, 'w', encoding='utf-8') as fd:
+        json.dump(failures, fd, indent=2, sort_keys=True)
+
+    if not failures:
+        return
+    for failure in failures:
+        logger.warning(failure_message(failure),
+                       location=(failure['document'], failure['line']))
+    raise SphinxError("{0} schema examples failed; see {1}".format(
+        len(failures), path))
+
+
+def all_examples(env):
+    return [example
+            for docname, examples in sorted(
+                getattr(env, 'jsonschema_examples', {}).items())
+            for example in examples]
+
+
+def validate_deferred(app, env):
+    env.jsonschema_deferred_failures = []
+    if not deferred_validation(app.config):
+        return
+
+    examples = all_examples(env)
+    used = set(example.key for example in examples)
+    env.jsonschema_results = dict(
+        (key, result) for key, result in env.jsonschema_results.items()
+        if key in used)
+    env.jsonschema_over_budget = dict(
+        (key, message) for key, message in env.jsonschema_over_budget.items()
+        if key in used)
+    env.jsonschema_timings = dict(
+        (key, seconds) for key, seconds in env.jsonschema_timings.items()
+        if key in used)
+
+    pending = OrderedDict()
+    for example in examples:
+        key = example.key
+        # Results cached for an instance that should fail are looked at
+        # again once it should pass, for the details of its failure.
+        if key in env.jsonschema_results and not unexplained(
+                env.jsonschema_results[key], example.should_pass):
+            continue
+        if key in result_cache.results and not unexplained(
+                result_cache.results[key], example.should_pass):
+            env.jsonschema_results[key] = result_cache.results[key]
+        else:
+            pending[key] = (example.standard, example.schema,
+                            example.content, example.schema_path,
+                            example.path, example.should_pass)
+
+    env.jsonschema_results.update(run_batch(
+        app, env, pending, 'schema examples', 'deferred validation'))
+
+    for example in examples:
+        is_valid, message = env.jsonschema_results[example.key]
+        # Reported by report_budget; the build goes on.
+        if is_valid == example.should_pass or \
+                example.key in env.jsonschema_over_budget:
+            continue
+        source = env.doc2path(example.docname)
+        if app.config.jsonschema_keep_going:
+            env.jsonschema_deferred_failures.append(failure_record(
+                example.docname, source, example.lineno, example.standard,
+                example.should_pass, is_valid, message, example.content))
+        elif is_valid is None:
+            raise ValueError("{0}:{1}: {2}".format(
+                source, example.lineno, message))
+        else:
+            raise ValueError("{0}:{1}: {2}".format(
+                source, example.lineno, mismatch_message(
+                    example.should_pass, example.content, message)))
+
+
+def run_batch(app, env, pending, what, name):
+    """
+    Validate the `pending` examples, by result cache key, on the worker
+    pool, returning their results by key and caching them.
+    """
+    if not pending:
+        return {}
+    logger.info("validating %d %s... ", len(pending), what, nonl=True)
+    # Sorted by draft and schema, so that the examples of a schema are
+    # validated together and it is compiled once per worker.
+    keys = sorted(pending, key=lambda key: tuple(
+        '' if item is None else item for item in pending[key]))
+    # Validations done in worker processes are not profiled, only
+    # the batch as a whole.
+    first = len(profiler.validations)
+    start = time.perf_counter()
+    examples = [pending[key] for key in keys]
+    workers = app.config.jsonschema_validation_workers
+    limits = validation_budget(app.config)
+    if limits is None:
+        results = validate_batch(examples, workers)
+    else:
+        results = []
+        for key, (status, result, seconds) in zip(
+                keys, validate_budgeted(examples, workers, *limits)):
+            env.jsonschema_timings[key] = seconds
+            if status != 'ok':
+                result = (None, over_budget_message(status, result, *limits))
+            # A validation that crashed fails like an invalid schema.
+            if status in budget.OVER_BUDGET:
+                env.jsonschema_over_budget[key] = result[1]
+            else:
+                env.jsonschema_over_budget.pop(key, None)
+            results.append(result)
+    if profiler.enabled:
+        validations = profiler.validations[first:]
+        del profiler.validations[first:]
+        profiler.add(env, '({0})'.format(name), 0, name,
+                     time.perf_counter() - start, validations)
+    results = dict((key, [is_valid, message])
+                   for key, (is_valid, message) in zip(keys, results))
+    # Invalid schemas are never cached, so they fail every build.
+    result_cache.update(dict(
+        (key, result) for key, result in results.items()
+        if result[0] is not None))
+    logger.info("done")
+    return results
+
+
+def report_budget(app, exception):
+    """
+    Warn about the examples that went over the validation budget, list
+    the slowest ones and write both to jsonschema-budget.json.
+    """
+    if exception is not None or validation_budget(app.config) is None:
+        return
+    env = app.env
+    over_budget = getattr(env, 'jsonschema_over_budget', {})
+    timings = getattr(env, 'jsonschema_timings', {})
+
+    def example_json(example, **fields):
+        return dict(
+            fields, document=example.docname,
+            source=os.path.relpath(env.doc2path(example.docname),
+                                   app.srcdir),
+            line=example.lineno, draft=example.standard)
+
+    examples = all_examples(env)
+    failed = [example_json(example, message=over_budget[example.key])
+              for example in examples if example.key in over_budget]
+    slowest = sorted(
+        (example_json(example, seconds=timings[example.key])
+         for example in examples if example.key in timings),
+        key=lambda example: -example['seconds'])
+    slowest = slowest[:app.config.jsonschema_slowest_examples]
+
+    os.makedirs(app.outdir, exist_ok=True)
+    path = os.path.join(app.outdir, 'jsonschema-budget.json')
+    with open(path, 'w', encoding='utf-8') as fd:
+        json.dump({'over_budget': failed, 'slowest': slowest}, fd,
+                  indent=2, sort_keys=True)
+
+    for example in failed:
+        logger.warning(example['message'],
+                       location=(example['document'], example['line']))
+    if slowest:
+        logger.info('slowest schema examples:')
+        for example in slowest:
+            logger.info('%9.4fs  %s:%d', example['seconds'],
+                        example['source'], example['line'])
+
+
+def record_source_text(text, path):
+    # Like `source_text`, for what an `ExampleRecord` keeps
+    if path is None:
+        return text
+    return 'file:' + load_external(path, False).external.sha1
+
+
+def validate_matrix(app, env):
+    """
+    Validate every example against every draft in `DRAFTS`, into
+    `env.jsonschema_matrix`: the results by draft, by example key.
+    """
+    if not app.config.jsonschema_draft_matrix:
+        return
+    previous = getattr(env, 'jsonschema_matrix', {})
+    env.jsonschema_matrix = matrix = {}
+    pending = OrderedDict()
+    cells = []
+    for example in all_examples(env):
+        if example.key in matrix:
+            continue
+        if example.key in previous:
+            matrix[example.key] = previous[example.key]
+            continue
+        row = matrix[example.key] = {}
+        schema_text = record_source_text(example.schema, example.schema_path)
+        part_text = record_source_text(example.content, example.path)
+        for standard in DRAFTS:
+            key = result_cache.text_key(standard, schema_text, part_text)
+            if key in result_cache.results:
+                row[standard] = result_cache.results[key]
+                continue
+            pending[key] = (standard, example.schema, example.content,
+                            example.schema_path, example.path,
+                            example.should_pass)
+            cells.append((row, standard, key))
+
+    results = run_batch(app, env, pending, 'draft matrix cells',
+                        'draft matrix')
+    for row, standard, key in cells:
+        row[standard] = results[key]
+
+
+def draft_name(standard):
+    match = re.search(r'draft[-/]0?(\d+(?:-\d+)?)', standard)
+    return match.group(1) if match else standard
+
+
+def matrix_report(rows):
+    """
+    The compatibility matrix as JSON, from `(record, should_pass,
+    results)` rows, where `record` has the example location and
+    `results` the `(is_valid, message)` of each draft.
+    """
+    examples = []
+    summary = dict((standard, {'as_documented': 0, 'differs': 0,
+                               'invalid_schema': 0})
+                   for standard in DRAFTS)
+    for record, should_pass, results in rows:
+        outcomes = {}
+        for standard in DRAFTS:
+            is_valid = results[standard][0]
+            if is_valid is None:
+                outcome = 'invalid_schema'
+            elif is_valid == should_pass:
+                outcome = 'as_documented'
+            else:
+                outcome = 'differs'
+            outcomes[standard] = outcome
+            summary[standard][outcome] += 1
+        examples.append(dict(record, drafts=outcomes, as_documented=[
+            standard for standard in DRAFTS
+            if outcomes[standard] == 'as_documented']))
+    return {'drafts': DRAFTS, 'summary': summary, 'examples': examples}
+
+
+def write_matrix(app, exception):
+    if exception is not None or not app.config.jsonschema_draft_matrix:
+        return
+    env = app.env
+    matrix = getattr(env, 'jsonschema_matrix', {})
+    rows = [
+        ({'document': example.docname,
+          'source': os.path.relpath(env.doc2path(example.docname),
+                                    app.srcdir),
+          'line': example.lineno,
+          'draft': example.standard,
+          'should_pass': example.should_pass},
+         example.should_pass, matrix[example.key])
+        for example in all_examples(env) if example.key in matrix]
+    os.makedirs(app.outdir, exist_ok=True)
+    path = os.path.join(app.outdir, 'jsonschema-matrix.json')
+    with open(path, 'w', encoding='utf-8') as fd:
+        json.dump(matrix_report(rows), fd, indent=2, sort_keys=True)
+    logger.info('jsonschema draft matrix written to %s', path)
+
+
+def add_draft_badges(app, doctree, docname):
+    # Styled by jsonschema.css, so only in HTML
+    if not app.config.jsonschema_draft_badges or \
+            app.builder.format != 'html':
+        return
+    matrix = getattr(app.env, 'jsonschema_matrix', {})
+    for node in doctree.traverse(jsonschema_node):
+        row = matrix.get(node.get('jsonschema_example'))
+        if row is None:
+            continue
+        paragraph = nodes.paragraph('', 'As shown in drafts: ')
+        paragraph['classes'] = ['jsonschema-drafts']
+        standards = [standard for standard in DRAFTS
+                     if row[standard][0] == node['jsonschema_should_pass']]
+        for i, standard in enumerate(standards):
+            if i:
+                paragraph += nodes.Text(', ')
+            badge = nodes.inline('', draft_name(standard))
+            badge['classes'] = ['jsonschema-draft']
+            paragraph += badge
+        if not standards:
+            paragraph += nodes.Text('none')
+        node.parent.insert(node.parent.index(node) + 1, paragraph)
+
+
+def resolve_example_classes(app, doctree, docname):
+    results = getattr(app.env, 'jsonschema_results', {})
+    for node in doctree.traverse(jsonschema_node):
+        if 'jsonschema_key' not in node:
+            continue
+        is_valid, message = results[node['jsonschema_key']]
+        if is_valid is None:
+            continue
+        classes = ['jsonschema-pass' if is_valid else 'jsonschema-fail']
+        node['classes'] = classes
+        for literal in node.traverse(nodes.literal_block):
+            literal['classes'] = list(classes)
+
+
+def example_record_json(example, source, srcdir):
+    schema = load_json(example.schema)
+    if example.schema_path is not None:
+        schema = load_external(example.schema_path).json
+    instance = load_json(example.content)
+    if example.path is not None:
+        instance = load_external(example.path, False).json
+    return {
+        'document': example.docname,
+        'source': source,
+        'line': example.lineno,
+        'draft': example.standard,
+        'schema': schema,
+        'schema_hl_lines': list(example.schema_hl_lines),
+        'instance': None if instance is INVALID_JSON else instance,
+        'instance_text': None if example.path else example.content,
+        'schema_file': example.schema_path and os.path.relpath(
+            example.schema_path, srcdir),
+        'instance_file': example.path and os.path.relpath(
+            example.path, srcdir),
+        'valid_json': instance is not INVALID_JSON,
+        'should_pass': example.should_pass,
+        'hl_lines': list(example.hl_lines),
+    }
+
+
+class ExampleSummaryBuilder(Builder):
+    """
+    A builder that reads the documents, and so validates their examples,
+    but writes no pages: only what `finish` makes of the examples.
+    """
+    format = ''
+    allow_parallel = True
+
+    def get_outdated_docs(self):
+        return 'all examples'
+
+    def get_target_uri(self, docname, typ=None):
+        return ''
+
+    def prepare_writing(self, docnames):
+        pass
+
+    def write(self, *args, **kwargs):
+        pass
+
+    def write_doc(self, docname, doctree):
+        pass
+
+
+class ExamplesBuilder(ExampleSummaryBuilder):
+    """
+    Writes every validated `schema_example` instance to `examples.jsonl`,
+    one JSON object per line, in document order.  Nothing else is written.
+    """
+    name = 'jsonschema-examples'
+    epilog = 'The examples are in %(outdir)s/examples.jsonl.'
+
+    def finish(self):
+        os.makedirs(self.outdir, exist_ok=True)
+        path = os.path.join(self.outdir, 'examples.jsonl')
+        count = 0
+        with open(path, 'w', encoding='utf-8') as fd:
+            for example in all_examples(self.env):
+                source = os.path.relpath(
+                    self.env.doc2path(example.docname), self.srcdir)
+                fd.write(json.dumps(
+                    example_record_json(example, source, self.srcdir),
+                    sort_keys=True))
+                fd.write('\n')
+                count += 1
+        logger.info('%d schema examples written to %s', count, path)
+
+
+class CheckBuilder(ExampleSummaryBuilder):
+    """
+    Only validates the examples, reporting every failure as with
+    `jsonschema_keep_going`, and writes a summary to
+    `jsonschema-check.json`.  Only the documents changed since the last
+    build, with any builder sharing the doctree directory, are read.
+    """
+    name = 'jsonschema-check'
+    epilog = 'The summary is in %(outdir)s/jsonschema-check.json.'
+
+    def init(self):
+        self.config.jsonschema_keep_going = True
+        self.read_docnames = set()
+        self.app.connect('env-before-read-docs', self.note_read)
+
+    def note_read(self, app, env, docnames):
+        self.read_docnames.update(docnames)
+
+    def finish(self):
+        env = self.env
+        examples = all_examples(env)
+        failures = (
+            [failure
+             for doc_failures in env.jsonschema_failures.values()
+             for failure in doc_failures] +
+            env.jsonschema_deferred_failures)
+        over_budget = getattr(env, 'jsonschema_over_budget', {})
+        summary = {
+            'documents': len(env.jsonschema_examples),
+            'examples': len(examples),
+            'failed': len(failures),
+            'over_budget': sum(1 for example in examples
+                               if example.key in over_budget),
+            'read': sorted(self.read_docnames),
+        }
+        os.makedirs(self.outdir, exist_ok=True)
+        path = os.path.join(self.outdir, 'jsonschema-check.json')
+        with open(path, 'w', encoding='utf-8') as fd:
+            json.dump(summary, fd, indent=2, sort_keys=True)
+        logger.info('%d schema examples in %d documents checked (%d read), '
+                    '%d failed', summary['examples'], summary['documents'],
+                    len(self.read_docnames), summary['failed'])
+
+
+def result_keys(app, env):
+    """
+    The result cache keys of every example in `env`, and of its draft
+    matrix cells when the matrix is built.
+    """
+    keys = set()
+    for example in all_examples(env):
+        keys.add(example.key)
+        if app.config.jsonschema_draft_matrix:
+            schema_text = record_source_text(
+                example.schema, example.schema_path)
+            part_text = record_source_text(example.content, example.path)
+            keys.update(result_cache.text_key(standard, schema_text,
+                                              part_text)
+                        for standard in DRAFTS)
+    return keys
+
+
+def save_result_cache(app, exception):
+    result_cache.update(getattr(app.env, 'jsonschema_new_results', None))
+    # After a failed build, the examples it did not get to are kept.
+    if exception is None:
+        result_cache.prune(result_keys(app, app.env))
+    result_cache.save()
+
+
+def report_cache_stats(app, exception):
+    logger.verbose("jsonschema validator cache: %d hits, %d misses",
+                   validator_cache.hits, validator_cache.misses)
+
+
 def setup(app):
+    app.setup_extension('sphinxext.profile')
+    app.setup_extension('sphinxext.highlight')
+
     app.add_config_value('jsonschema_standard', 'http://json-schema.org/draft-04/schema#', 'env')
+    app.add_config_value('jsonschema_deferred_validation', False, 'env')
+    app.add_config_value('jsonschema_validation_workers', 0, '')
+    app.add_config_value('jsonschema_validation_timeout', 0, 'env')
+    app.add_config_value('jsonschema_validation_memory', 0, 'env')
+    app.add_config_value('jsonschema_slowest_examples', 10, '')
+    app.add_config_value('jsonschema_keep_going', False, '')
+    app.add_config_value('jsonschema_json_decoder', None, '')
+    app.add_config_value('jsonschema_validator_backend', 'default', 'env')
+    app.add_config_value('jsonschema_assert_formats', False, 'env')
+    app.add_config_value('jsonschema_external_max_bytes', 64 * 1024 * 1024,
+                         'env')
+    app.add_config_value('jsonschema_external_preview_lines', 50, 'env')
+    app.add_config_value('jsonschema_schema_dir', None, 'env')
+    app.add_config_value('jsonschema_highlight_language', 'javascript', 'env')
+    app.add_config_value('jsonschema_draft_matrix', False, '')
+    app.add_config_value('jsonschema_draft_badges', False, 'html')
+
+    app.add_builder(ExamplesBuilder)
+    app.add_builder(CheckBuilder)
 
     app.add_directive('schema_example',
                       SchemaExampleDirective)
     app.add_directive('schema_example_novalid',
                       SchemaExampleNoValidationDirective)
 
+    app.connect('builder-inited', init_backend)
+    app.connect('builder-inited', init_json_decoder)
+    app.connect('builder-inited', init_schema_registry)
+    app.connect('builder-inited', load_result_cache)
+    app.connect('env-get-outdated', outdated_by_schemas)
+    app.connect('env-before-read-docs', init_new_results)
+    app.connect('env-merge-info', merge_new_results)
+    app.connect('env-before-read-docs', init_examples)
+    app.connect('env-purge-doc', purge_examples)
+    app.connect('env-merge-info', merge_examples)
+    app.connect('env-updated', validate_deferred)
+    app.connect('env-updated', validate_matrix)
+    app.connect('doctree-resolved', resolve_example_classes)
+    app.connect('doctree-resolved', add_draft_badges)
+    app.connect('build-finished', save_result_cache)
+    app.connect('build-finished', report_budget)
+    app.connect('build-finished', write_matrix)
+    app.connect('build-finished', report_cache_stats)
+    # Last, since it raises when examples failed, which stops the
+    # handlers after it.
+    app.connect('build-finished', report_failures)
+
     app.add_node(
         jsonschema_node,
         html=(visit_jsonschema_node_html, depart_jsonschema_node_html),
         latex=(visit_jsonschema_node_latex, depart_jsonschema_node_latex))
 
+    return {
+        'env_version': 7,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
+
 
 passoptionstopackages = r'\PassOptionsToPackage{dvipsnames}{xcolor}'
 
@@ -252,3 +1577,270 @@ latex_preamble = r"""
 \usepackage{changepage}
 \usepackage{xcolor}
 """
+
+
+option_re = re.compile(r'^\s*:([\w-]+):\s*(.*?)\s*$')
+
+
+def extract_directives(lines, name):
+    """
+    Find the `name` directives in reST source `lines`, yielding
+    `(lineno, argument, content, first_line, options)` for each, where
+    `argument` is `None` when the directive has none, `content` is the
+    dedented directive body, `first_line` the line it starts on and
+    `options` a dict of the directive options.
+    """
+    directive_re = re.compile(
+        r'^(\s*)\.\. ' + re.escape(name) + r'::\s*(\S*)\s*$')
+    i = 0
+    while i < len(lines):
+        match = directive_re.match(lines[i])
+        i += 1
+        if match is None:
+            continue
+        lineno = i
+        indent = len(match.group(1))
+        options = {}
+        while i < len(lines):
+            option = option_re.match(lines[i])
+            if option is None:
+                break
+            options[option.group(1)] = option.group(2)
+            i += 1
+        block = []
+        while i < len(lines) and (
+                not lines[i].strip() or
+                len(lines[i]) - len(lines[i].lstrip()) > indent):
+            block.append(lines[i].rstrip())
+            i += 1
+        first_line = i - len(block) + 1
+        while block and not block[0]:
+            block.pop(0)
+            first_line += 1
+        while block and not block[-1]:
+            block.pop()
+        margin = min(len(line) - len(line.lstrip())
+                     for line in block if line) if block else 0
+        yield lineno, match.group(2) or None, [
+            line[margin:] for line in block], first_line, options
+
+
+def extract_examples(lines):
+    return extract_directives(lines, 'schema_example')
+
+
+def configured_value(srcdir, name, default):
+    with open(os.path.join(srcdir, 'conf.py'), encoding='utf-8') as fd:
+        tree = ast.parse(fd.read())
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and
+                any(getattr(target, 'id', None) == name
+                    for target in node.targets)):
+            return ast.literal_eval(node.value)
+    return default
+
+
+def configured_standard(srcdir):
+    return configured_value(srcdir, 'jsonschema_standard',
+                            'http://json-schema.org/draft-04/schema#')
+
+
+def check_split_content(srcdir, path, content, first_line, options):
+    def load(filename, should_pass=True):
+        if filename.startswith('/'):
+            filename = os.path.join(srcdir, filename[1:])
+        else:
+            filename = os.path.join(os.path.dirname(path), filename)
+        return load_external(os.path.normpath(filename), should_pass)
+
+    # Every failure is reported, so an instance that is not valid JSON
+    # fails on its own rather than taking the others with it.
+    return split_example(content, first_line, options, load, strict=False)
+
+
+def check(args):
+    select_backend(args.backend or configured_value(
+        args.srcdir, 'jsonschema_validator_backend', 'default'))
+    set_assert_formats(bool(args.assert_formats or configured_value(
+        args.srcdir, 'jsonschema_assert_formats', False)))
+    standard = args.standard or configured_standard(args.srcdir)
+    schema_dir = args.schemas or configured_value(
+        args.srcdir, 'jsonschema_schema_dir', None)
+    if schema_dir:
+        set_schemas(load_schemas(os.path.join(args.srcdir, schema_dir)))
+    failures = []
+    examples = []
+    for root, dirs, files in os.walk(args.srcdir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '_')))
+        for filename in sorted(files):
+            if not filename.endswith('.rst'):
+                continue
+            path = os.path.relpath(os.path.join(root, filename))
+            docname = os.path.splitext(os.path.relpath(
+                path, args.srcdir))[0].replace(os.sep, '/')
+            with open(path, encoding='utf-8') as fd:
+                lines = fd.read().splitlines()
+            for lineno, example_standard, content, first_line, options in \
+                    extract_examples(lines):
+                example_standard = example_standard or standard
+                try:
+                    schema, parts = check_split_content(
+                        args.srcdir, path, content, first_line, options)
+                except ValueError as e:
+                    failures.append(failure_record(
+                        docname, path, getattr(e, 'lineno', None) or lineno,
+                        example_standard, True, None, str(e),
+                        '\n'.join(content)))
+                    continue
+                for part in parts:
+                    examples.append(
+                        ((docname, path, part.lineno or lineno,
+                          example_standard, part.should_pass, part.content),
+                         (example_standard, schema.content, part.content,
+                          schema.external and schema.external.path,
+                          part.external and part.external.path,
+                          part.should_pass)))
+
+    tasks = [example for _, example in examples]
+    over_budget = set()
+    if args.timeout or args.memory:
+        limits = (args.timeout, args.memory * 1024 * 1024)
+        outcomes = validate_budgeted(tasks, args.workers, *limits)
+        results = []
+        for i, (status, result, seconds) in enumerate(outcomes):
+            if status != 'ok':
+                result = (None, over_budget_message(status, result, *limits))
+            if status in budget.OVER_BUDGET:
+                over_budget.add(i)
+            results.append(result)
+    else:
+        outcomes = None
+        results = validate_batch(tasks, args.workers)
+    for i, (((docname, path, lineno, example_standard, should_pass,
+              content), _), (is_valid, message)) in enumerate(
+                zip(examples, results)):
+        if i in over_budget:
+            print("{0}:{1}: {2}".format(path, lineno, message))
+        elif is_valid != should_pass:
+            failures.append(failure_record(
+                docname, path, lineno, example_standard, should_pass,
+                is_valid, message, content))
+
+    failures.sort(key=lambda failure: (failure['source'], failure['line']))
+    for failure in failures:
+        print("{0}:{1}: {2}".format(failure['source'], failure['line'],
+                                    failure_message(failure)))
+    if outcomes:
+        print("slowest examples:")
+        for (record, _), (_, _, seconds) in sorted(
+                zip(examples, outcomes), key=lambda item: -item[1][2])[:10]:
+            print("{0:9.4f}s  {1}:{2}".format(seconds, record[1], record[2]))
+    print("{0} examples checked, {1} failed".format(
+        len(examples), len(failures)))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as fd:
+            json.dump(failures, fd, indent=2, sort_keys=True)
+    if args.matrix:
+        check_matrix(args, examples, results)
+    return 1 if failures else 0
+
+
+def check_matrix(args, examples, results):
+    # The results in the example's own draft are already known.
+    cells = [(i, standard) for i, (_, example) in enumerate(examples)
+             for standard in DRAFTS if standard != example[0]]
+    matrix = validate_batch(
+        [(standard,) + examples[i][1][1:] for i, standard in cells],
+        args.workers)
+    rows = [{} for _ in examples]
+    for (i, standard), result in zip(cells, matrix):
+        rows[i][standard] = result
+    for i, ((_, _, _, example_standard, _, _), _) in enumerate(examples):
+        rows[i][example_standard] = results[i]
+    with open(args.matrix, 'w', encoding='utf-8') as fd:
+        json.dump(matrix_report(
+            ({'document': docname, 'source': path, 'line': lineno,
+              'draft': example_standard, 'should_pass': should_pass},
+             should_pass, row)
+            for ((docname, path, lineno, example_standard, should_pass, _),
+                 _), row in zip(examples, rows)), fd, indent=2,
+            sort_keys=True)
+
+
+def serve(args):
+    from .serve import serve
+    return serve(args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m sphinxext.jsonschemaext',
+        description="Validate the schema examples without running Sphinx, "
+                    "or serve the documentation while editing it.")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    parser_check = commands.add_parser(
+        'check', help="validate every schema_example in the sources")
+    parser_check.add_argument(
+        'srcdir', nargs='?', default='.',
+        help="the documentation source directory (default: %(default)s)")
+    parser_check.add_argument(
+        '--standard',
+        help="the default standard (default: jsonschema_standard in conf.py)")
+    parser_check.add_argument(
+        '-j', '--workers', type=int, default=0,
+        help="number of worker processes (default: one per CPU)")
+    parser_check.add_argument(
+        '--backend', choices=['default'] + sorted(backends),
+        help="the validator backend (default: jsonschema_validator_backend "
+             "in conf.py)")
+    parser_check.add_argument(
+        '--assert-formats', action='store_true',
+        help="fail instances that do not match their format (default: "
+             "jsonschema_assert_formats in conf.py)")
+    parser_check.add_argument(
+        '--schemas', metavar='DIR',
+        help="the schemas examples may refer to, relative to srcdir "
+             "(default: jsonschema_schema_dir in conf.py)")
+    parser_check.add_argument(
+        '--timeout', type=float, default=0, metavar='SECONDS',
+        help="stop and report validations that take longer than this")
+    parser_check.add_argument(
+        '--memory', type=int, default=0, metavar='MIB',
+        help="stop and report validations that need more memory than this")
+    parser_check.add_argument(
+        '--report', metavar='PATH',
+        help="also write the failures to this file as JSON")
+    parser_check.add_argument(
+        '--matrix', metavar='PATH',
+        help="also validate every example in every draft and write the "
+             "results to this file as JSON")
+    parser_check.set_defaults(func=check)
+    parser_serve = commands.add_parser(
+        'serve', help="rebuild the HTML pages as the sources change and "
+                      "serve them with live reload")
+    parser_serve.add_argument(
+        'srcdir', nargs='?', default='.',
+        help="the documentation source directory (default: %(default)s)")
+    parser_serve.add_argument(
+        '-o', '--outdir', default='../build/html',
+        help="the output directory (default: %(default)s)")
+    parser_serve.add_argument(
+        '-d', '--doctreedir', default='../build/doctrees',
+        help="the doctree and environment directory (default: %(default)s)")
+    parser_serve.add_argument(
+        '--host', default='localhost',
+        help="the address to listen on (default: %(default)s)")
+    parser_serve.add_argument(
+        '--port', type=int, default=8000,
+        help="the port to listen on (default: %(default)s)")
+    parser_serve.add_argument(
+        '--interval', type=float, default=0.3,
+        help="seconds between checks for changes (default: %(default)s)")
+    parser_serve.set_defaults(func=serve)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Opt-in build profiling for the documentation extensions.
+
+With `jsonschema_profile = True`, every `schema_example`, `draft_specific`
+and `language_specific` directive is timed, as is every validation it
+does, split into compile, metaschema check and evaluate time.  When the
+build finishes, `jsonschema-profile.txt` and `jsonschema-profile.json`
+are written to the output directory, with the slowest directives first
+and totals per document and per engine.  The time and validations of a
+directive nested in another, such as a `schema_example` in a
+`draft_specific` block, are left out of the enclosing one's, so that
+the totals add up to the time the directives took.
+"""
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sphinx.util import logging
+
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('compile', 'metaschema', 'evaluate')
+
+
+class Profiler(object):
+    def __init__(self):
+        self.enabled = False
+        self.validations = []
+        self.current = None
+        # The time taken by the directives nested in each one being run
+        self.nested = []
+
+    @contextmanager
+    def validation(self, engine):
+        if not self.enabled:
+            yield
+            return
+        self.current = record = dict.fromkeys(PHASES, 0.0)
+        record['engine'] = engine
+        try:
+            yield
+        finally:
+            self.current = None
+            self.validations.append(record)
+
+    @contextmanager
+    def phase(self, name):
+        if self.current is None:
+            yield
+            return
+        record = self.current
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record[name] += time.perf_counter() - start
+
+    @contextmanager
+    def directive(self, directive, name):
+        if not self.enabled:
+            yield
+            return
+        env = directive.state.document.settings.env
+        first = len(self.validations)
+        self.nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            nested = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += seconds
+            validations = self.validations[first:]
+            del self.validations[first:]
+            self.add(env, env.docname, directive.lineno, name,
+                     seconds - nested, validations)
+
+    def add(self, env, docname, lineno, name, seconds, validations):
+        env.jsonschema_profile.setdefault(docname, []).append({
+            'docname': docname,
+            'line': lineno,
+            'directive': name,
+            'seconds': seconds,
+            'validations': validations,
+        })
+
+
+profiler = Profiler()
+
+
+def init_profiler(app):
+    profiler.enabled = app.config.jsonschema_profile
+
+
+def init_profile(app, env, docnames):
+    env.jsonschema_profile = {}
+
+
+def merge_profile(app, env, docnames, other):
+    env.jsonschema_profile.update(other.jsonschema_profile)
+
+
+def summarize(records):
+    documents = defaultdict(lambda: {'seconds': 0.0, 'directives': 0})
+    engines = defaultdict(lambda: dict(
+        dict.fromkeys(PHASES, 0.0), validations=0))
+    for record in records:
+        documents[record['docname']]['seconds'] += record['seconds']
+        documents[record['docname']]['directives'] += 1
+        for validation in record['validations']:
+            totals = engines[validation['engine']]
+            totals['validations'] += 1
+            for phase in PHASES:
+                totals[phase] += validation[phase]
+    return dict(documents), dict(engines)
+
+
+def format_report(records, documents, engines):
+    lines = ['Slowest directives', '']
+    for record in records:
+        phases = dict.fromkeys(PHASES, 0.0)
+        for validation in record['validations']:
+            for phase in PHASES:
+                phases[phase] += validation[phase]
+        lines.append(
+            '{0:9.4f}s  {1}:{2}  {3}  ({4} validations; compile {5:.4f}s, '
+            'metaschema {6:.4f}s, evaluate {7:.4f}s)'.format(
+                record['seconds'], record['docname'], record['line'],
+                record['directive'], len(record['validations']),
+                phases['compile'], phases['metaschema'],
+                phases['evaluate']))
+
+    lines += ['', 'Documents', '']
+    for docname, totals in sorted(
+            documents.items(), key=lambda item: -item[1]['seconds']):
+        lines.append('{0:9.4f}s  {1}  ({2} directives)'.format(
+            totals['seconds'], docname, totals['directives']))
+
+    lines += ['', 'Engines', '']
+    for engine, totals in sorted(engines.items()):
+        lines.append(
+            '{0}: {1} validations; compile {2:.4f}s, metaschema {3:.4f}s, '
+            'evaluate {4:.4f}s'.format(
+                engine, totals['validations'], totals['compile'],
+                totals['metaschema'], totals['evaluate']))
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(app, exception):
+    if exception is not None or not app.config.jsonschema_profile:
+        return
+    records = sorted(
+        (record
+         for doc_records in getattr(app.env, 'jsonschema_profile', {}).values()
+         for record in doc_records),
+        key=lambda record: -record['seconds'])
+    documents, engines = summarize(records)
+
+    os.makedirs(app.outdir, exist_ok=True)
+    path = os.path.join(app.outdir, 'jsonschema-profile')
+    with open(path + '.txt', 'w', encoding='utf-8') as fd:
+        fd.write(format_report(records, documents, engines))
+    with open(path + '.json', 'w', encoding='utf-8') as fd:
+        json.dump({'directives': records, 'documents': documents,
+                   'engines': engines}, fd, indent=2, sort_keys=True)
+    logger.info('jsonschema profile written to %s.txt', path)
+
+
+def setup(app):
+    app.add_config_value('jsonschema_profile', False, '')
+
+    app.connect('builder-inited', init_profiler)
+    app.connect('env-before-read-docs', init_profile)
+    app.connect('env-merge-info', merge_profile)
+    app.connect('build-finished', write_report)
+
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
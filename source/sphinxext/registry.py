@@ -0,0 +1,146 @@
+"""
+The schemas a `schema_example` may `$ref` without embedding them.
+
+The JSON files in `jsonschema_schema_dir` are loaded once per build, by
+their `$id` (or `id`), and handed to both validation engines along with
+the metaschemas bundled with them.  References to anything else fail
+instead of being fetched, so validation never touches the network.
+"""
+import hashlib
+import json
+import os
+
+
+class SchemaRegistry(object):
+    def __init__(self):
+        self.schemas = {}
+        self.digest = ''
+        self._referencing = {}
+
+    def set(self, schemas):
+        self.schemas = schemas
+        self.digest = hashlib.sha1(json.dumps(
+            schemas, sort_keys=True).encode('utf-8')).hexdigest()
+        self._referencing = {}
+
+    def jsonschema_options(self, cls, schema):
+        """
+        The keyword arguments for the jsonschema validator class `cls` to
+        resolve references in `schema` from the registry.
+        """
+        try:
+            import referencing.jsonschema
+        except ImportError:
+            # jsonschema before 4.18
+            import jsonschema
+            return {'resolver': jsonschema.RefResolver.from_schema(
+                schema, id_of=cls.ID_OF, store=self.schemas,
+                handlers={'http': refuse, 'https': refuse})}
+        registry = self._referencing.get(cls)
+        if registry is None:
+            from jsonschema_specifications import REGISTRY
+            # Schemas without a $schema are taken to be in the same draft
+            # as the example.
+            specification = referencing.jsonschema.specification_with(
+                cls.META_SCHEMA['$schema'])
+            registry = self._referencing[cls] = REGISTRY.combine(
+                referencing.Registry(retrieve=refuse).with_contents(
+                    self.schemas.items(),
+                    default_specification=specification)).crawl()
+        return {'registry': registry}
+
+    def lookup(self, uri):
+        """
+        The registry schema for `uri`, or else the metaschema jsonschema
+        bundles for it, for fastjsonschema's handlers.
+        """
+        uri = uri.split('#', 1)[0]
+        try:
+            return self.schemas[uri]
+        except KeyError:
+            pass
+        schema = bundled_metaschema(uri)
+        if schema is None:
+            refuse(uri)
+        return schema
+
+    def jschon_catalog(self, *versions):
+        """
+        A jschon catalog for `versions` that finds the registry schemas
+        before its own metaschema files.
+        """
+        from jschon import Catalog
+
+        schemas = dict(
+            (uri.rstrip('#'), schema) for uri, schema in self.schemas.items())
+
+        class RegistryCatalog(Catalog):
+            def load_json(self, uri):
+                try:
+                    return schemas[str(uri)]
+                except KeyError:
+                    return Catalog.load_json(self, uri)
+
+        return RegistryCatalog(*versions, default=True)
+
+
+def load_schemas(directory):
+    """
+    The schemas in every `.json` file under `directory`, by id.  Raises
+    ValueError if a file is not a schema with an id, or if two files
+    have the same id.
+    """
+    schemas = {}
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, encoding='utf-8') as fd:
+                try:
+                    schema = json.load(fd)
+                except ValueError as e:
+                    raise ValueError("{0}: {1}".format(path, e))
+            uri = schema_id(schema)
+            if uri is None:
+                raise ValueError("{0}: the schema has no $id".format(path))
+            if uri in schemas:
+                raise ValueError("{0}: {1} is already in the registry".format(
+                    path, uri))
+            schemas[uri] = schema
+    return schemas
+
+
+def schema_id(schema):
+    if not isinstance(schema, dict):
+        return None
+    uri = schema.get('$id', schema.get('id'))
+    if not isinstance(uri, str):
+        return None
+    return uri.rstrip('#')
+
+
+def bundled_metaschema(uri):
+    try:
+        from jsonschema_specifications import REGISTRY
+    except ImportError:
+        # jsonschema before 4.18
+        import jsonschema
+        for schema_uri in (uri, uri + '#'):
+            cls = jsonschema.validators.validator_for(
+                {'$schema': schema_uri}, default=None)
+            if cls is not None:
+                return cls.META_SCHEMA
+        return None
+    try:
+        return REGISTRY.contents(uri)
+    except LookupError:
+        return None
+
+
+def refuse(uri):
+    raise LookupError("{0} is not in the schema registry".format(uri))
+
+
+schema_registry = SchemaRegistry()
@@ -0,0 +1,291 @@
+"""
+A development server for the documentation, for
+`python -m sphinxext.jsonschemaext serve`.
+
+One Sphinx application is kept alive for the whole session, so the
+validation engines, the jschon catalog, the compiled validators and the
+validation results stay warm between builds.  The sources are polled for
+changes; each change rebuilds incrementally, which re-reads only the
+changed pages and, through the result cache, revalidates only the
+`schema_example` blocks whose text changed.  Pages served over HTTP
+reload themselves once they have been rewritten.  A changed conf.py, or
+a changed schema in `jsonschema_schema_dir`, which is only loaded as the
+application starts, starts a new application; changes to the extensions
+need a restart.
+"""
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+
+LIVERELOAD_PATH = '/__livereload__'
+
+LIVERELOAD_SCRIPT = """
+<script>
+(function () {
+  var page = %(page)d, build = %(build)d;
+  function show(error) {
+    var banner = document.getElementById('livereload-error');
+    if (!banner) {
+      banner = document.createElement('pre');
+      banner.id = 'livereload-error';
+      banner.style.cssText = 'position:fixed;bottom:0;left:0;right:0;' +
+        'max-height:40%%;overflow:auto;margin:0;padding:1em;z-index:9999;' +
+        'background:#fdd;color:#600;border-top:2px solid #c00';
+      document.body.appendChild(banner);
+    }
+    banner.style.display = error ? 'block' : 'none';
+    banner.textContent = error || '';
+  }
+  function poll() {
+    fetch('%(path)s?page=' + encodeURIComponent(location.pathname) +
+          '&since=' + page + '&build=' + build)
+      .then(function (response) { return response.json(); })
+      .then(function (state) {
+        if (state.reload) {
+          location.reload();
+          return;
+        }
+        build = state.build;
+        show(state.error);
+        poll();
+      })
+      .catch(function () { setTimeout(poll, 1000); });
+  }
+  poll();
+})();
+</script>
+"""
+
+
+def snapshot(srcdir, ignore):
+    """
+    The modification time of every file under `srcdir`, by path, leaving
+    out the directories in `ignore`.
+    """
+    mtimes = {}
+    for root, dirs, files in os.walk(srcdir):
+        dirs[:] = [d for d in dirs
+                   if not d.startswith('.') and d != '__pycache__' and
+                   os.path.join(root, d) not in ignore]
+        for filename in files:
+            path = os.path.join(root, filename)
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+    return mtimes
+
+
+def in_directory(path, directory):
+    return os.path.commonpath([path, directory]) == directory
+
+
+class DevServer(object):
+    def __init__(self, srcdir, outdir, doctreedir, buildername='html',
+                 confoverrides=None):
+        self.srcdir = os.path.abspath(srcdir)
+        self.outdir = os.path.abspath(outdir)
+        self.doctreedir = os.path.abspath(doctreedir)
+        self.buildername = buildername
+        self.confoverrides = dict(confoverrides or {})
+        self.app = None
+        self.written = set()
+        # Generations: `build` counts the builds, `pages` holds the build
+        # that last wrote each page and `everything` the last one that
+        # changed files every page may depend on.
+        self.build_generation = 0
+        self.pages = {}
+        self.everything = 0
+        self.error = None
+        self.changed = threading.Condition()
+
+    def make_app(self):
+        from sphinx.application import Sphinx
+        self.app = Sphinx(
+            self.srcdir, self.srcdir, self.outdir, self.doctreedir,
+            self.buildername, confoverrides=self.confoverrides,
+            status=None, warning=sys.stderr, freshenv=False)
+        self.app.connect('doctree-resolved', self.note_written)
+
+    def note_written(self, app, doctree, docname):
+        self.written.add(docname)
+
+    def build(self, restart=False, everything=False):
+        start = time.perf_counter()
+        self.written = set()
+        error = None
+        try:
+            if restart or self.app is None:
+                self.make_app()
+            self.app.build()
+        except Exception as e:
+            error = '{0}: {1}'.format(type(e).__name__, e)
+        seconds = time.perf_counter() - start
+
+        with self.changed:
+            self.build_generation += 1
+            for docname in self.written:
+                self.pages[self.page_path(docname)] = self.build_generation
+            if everything:
+                self.everything = self.build_generation
+            self.error = error
+            self.changed.notify_all()
+
+        if error is None:
+            print('rebuilt {0} pages in {1:.2f}s'.format(
+                len(self.written), seconds))
+        else:
+            print('build failed after {0:.2f}s\n{1}'.format(seconds, error))
+
+    def schema_dir(self):
+        directory = self.app and self.app.config.jsonschema_schema_dir
+        if not directory:
+            return None
+        return os.path.abspath(os.path.join(self.app.confdir, directory))
+
+    def snapshot(self, ignore):
+        # The schema directory may be outside of the sources.
+        mtimes = snapshot(self.srcdir, ignore)
+        schemas = self.schema_dir()
+        if schemas is not None and not in_directory(schemas, self.srcdir):
+            mtimes.update(snapshot(schemas, ignore))
+        return mtimes
+
+    def page_path(self, docname):
+        return '/' + self.app.builder.get_target_uri(docname)
+
+    def page_generation(self, path):
+        if path.endswith('/'):
+            path += 'index.html'
+        return max(self.pages.get(path, 0), self.everything)
+
+    def wait(self, path, since, build, timeout=25):
+        """
+        Wait until the page at `path` is rewritten after generation
+        `since`, or a build after `build` finishes, or `timeout` passes.
+        """
+        with self.changed:
+            self.changed.wait_for(
+                lambda: (self.page_generation(path) > since or
+                         self.build_generation > build), timeout)
+            return {
+                'reload': self.page_generation(path) > since,
+                'build': self.build_generation,
+                'error': self.error,
+            }
+
+    def watch(self, interval):
+        ignore = set([self.outdir, self.doctreedir])
+        mtimes = self.snapshot(ignore)
+        conf = os.path.join(self.srcdir, 'conf.py')
+        while True:
+            time.sleep(interval)
+            current = self.snapshot(ignore)
+            if current == mtimes:
+                continue
+            changed = set(
+                path for path in set(current) | set(mtimes)
+                if current.get(path) != mtimes.get(path))
+            mtimes = current
+            for path in sorted(changed):
+                print('changed: {0}'.format(
+                    os.path.relpath(path, self.srcdir)))
+            # Sphinx finds the changed pages by itself; anything but a
+            # page may be used by all of them.
+            schemas = self.schema_dir()
+            restart = conf in changed or (schemas is not None and any(
+                in_directory(path, schemas) for path in changed))
+            everything = restart or any(
+                not path.endswith('.rst') for path in changed)
+            self.build(restart, everything)
+
+    def make_handler(self):
+        server = self
+
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=server.outdir, **kwargs)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == LIVERELOAD_PATH:
+                    self.send_state(parse_qs(url.query))
+                elif url.path.endswith(('/', '.html')):
+                    self.send_page(url.path)
+                else:
+                    super().do_GET()
+
+            def send_state(self, query):
+                state = server.wait(
+                    query.get('page', ['/'])[0],
+                    int(query.get('since', ['0'])[0]),
+                    int(query.get('build', ['0'])[0]))
+                self.send_body('application/json',
+                               json.dumps(state).encode('utf-8'))
+
+            def send_page(self, path):
+                page = self.translate_path(path)
+                if os.path.isdir(page):
+                    page = os.path.join(page, 'index.html')
+                try:
+                    with open(page, 'rb') as fd:
+                        body = fd.read()
+                except OSError:
+                    self.send_error(404)
+                    return
+                with server.changed:
+                    script = LIVERELOAD_SCRIPT % {
+                        'page': server.page_generation(path),
+                        'build': server.build_generation,
+                        'path': LIVERELOAD_PATH,
+                    }
+                body = body.replace(
+                    b'</body>', script.encode('utf-8') + b'</body>', 1)
+                self.send_body('text/html; charset=utf-8', body)
+
+            def send_body(self, content_type, body):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve(self, host, port, interval):
+        self.build()
+        httpd = http.server.ThreadingHTTPServer(
+            (host, port), self.make_handler())
+        httpd.daemon_threads = True
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        print('serving {0} on http://{1}:{2}/'.format(
+            self.outdir, host or 'localhost', port))
+        try:
+            self.watch(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.shutdown()
+
+
+def serve(args):
+    server = DevServer(
+        args.srcdir, args.outdir, args.doctreedir, confoverrides={
+            # Keep reporting failures instead of stopping at the first
+            # one, and validate deferred examples in this process, whose
+            # caches are warm, rather than on a new pool every time.
+            'jsonschema_keep_going': True,
+            'jsonschema_validation_workers': 1,
+        })
+    server.serve(args.host, args.port, args.interval)
+    return 0
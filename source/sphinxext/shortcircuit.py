@@ -0,0 +1,67 @@
+"""
+Pass/fail evaluation with jschon that stops at the first failing keyword.
+
+`JSONSchema.evaluate` evaluates every keyword of every subschema and
+keeps the annotations and errors of all of them, which the examples only
+need when one fails unexpectedly and the failure has to be explained.
+Within `short_circuit()`, a subschema stops at the first of its keywords
+that fails, since that settles its result.  The keywords that read the
+annotations of their siblings, such as `unevaluatedProperties`, come
+after them in jschon's keyword order, so they still see them.  Only a
+failed `contains` is evaluated past, as a later `minContains` of 0 may
+make it pass again.
+"""
+import threading
+from contextlib import contextmanager
+
+
+# Keywords whose failure a later keyword of the same subschema may reverse
+REVERSIBLE = frozenset(['contains'])
+
+_state = threading.local()
+
+
+@contextmanager
+def short_circuit():
+    install()
+    _state.active = True
+    try:
+        yield
+    finally:
+        _state.active = False
+
+
+def install():
+    from jschon import JSONSchema
+    if getattr(JSONSchema.evaluate, 'short_circuits', False):
+        return
+    evaluate = JSONSchema.evaluate
+
+    def short_circuit_evaluate(self, instance, scope=None):
+        if not getattr(_state, 'active', False) or \
+                not isinstance(self.data, dict):
+            return evaluate(self, instance, scope)
+        if scope is None:
+            from jschon.jsonschema import Scope
+            scope = Scope(self)
+        # Computed from the instance's parents on every access
+        path = instance.path
+        failed = []
+        for key, keyword in self.keywords.items():
+            if not keyword.can_evaluate(instance):
+                continue
+            with scope(instance, key, self) as subscope:
+                keyword.evaluate(instance, subscope)
+            # Discarded scopes, such as a `then` whose `if` failed, are
+            # no longer among the children.
+            child = scope.children[path].get(key)
+            if child is not None and not child.passed:
+                failed.append(child)
+                if key not in REVERSIBLE:
+                    break
+        if any(not child.passed for child in failed):
+            scope.fail()
+        return scope
+
+    short_circuit_evaluate.short_circuits = True
+    JSONSchema.evaluate = short_circuit_evaluate
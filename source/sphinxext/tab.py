@@ -1,33 +1,32 @@
 from docutils import nodes
-from docutils import statemachine
 from docutils.parsers.rst import Directive
+from docutils.transforms import Transform
 import re
 
-
-class AttrDict(dict):
-    def __init__(self, *args, **kwargs):
-        super(AttrDict, self).__init__(*args, **kwargs)
-        self.__dict__ = self
+from .example import TabPart, content_first_line
+from .profile import profiler
 
 
-def split_content(l):
+def split_content(l, first_line=None):
     parts = []
     part = []
     label = None
+    offset = 0
 
     def add_part():
         if label is None:
             raise ValueError("No label specified")
-        parts.append(AttrDict({
-            'label': label,
-            'content': part}))
+        parts.append(TabPart(
+            label, part, offset,
+            None if first_line is None else first_line + offset))
 
-    for line in l:
+    for i, line in enumerate(l):
         if line.startswith('--'):
             if len(part):
                 add_part()
                 part = []
             label = line[2:].strip()
+            offset = i + 1
         else:
             part.append(line)
 
@@ -56,12 +55,41 @@ class section(nodes.Element):
     pass
 
 
-def visit_pages_node_html(self, node):
+class tab_nav(nodes.Element):
+    """
+    The list of tab links above the tabs; only the HTML builders show it.
+    """
+
+
+class tab_content(section):
+    pass
+
+
+class tab_pane(section):
+    """
+    The content of one tab, labelled with its `label` attribute.
+    """
+
+
+class TabTransform(Transform):
+    """
+    Build the tab list and the tab panes of every `pages` node out of its
+    `parts` once, right after the document is read, so that the doctree
+    pickled in the environment already has them and the writers leave it
+    untouched.
+    """
+    default_priority = 500
+
+    def apply(self):
+        for node in self.document.traverse(pages):
+            build_tabs(node)
+
+
+def build_tabs(node):
     node['classes'] = ['tabbable']
 
     ul = nodes.bullet_list()
     ul['classes'] = ['nav', 'nav-tabs']
-    # set_source_info(self, ul)
 
     href = tab('', node.header)
     href['classes'] = ['disabled']
@@ -88,26 +116,30 @@ def visit_pages_node_html(self, node):
 
         first = False
 
-    node.append(ul)
+    node.append(tab_nav('', ul))
 
-    pages = section()
-    pages['classes'] = ['tab-content']
+    content = tab_content()
+    content['classes'] = ['tab-content']
 
     first = True
     for part in node.parts:
-        page = section()
+        page = tab_pane(label=part.label)
         page['classes'] = ['tab-pane']
         if first:
             page['classes'].append('active')
         page['ids'] = [make_id(node, part.label)]
 
         page.append(part.paragraph)
-        pages.append(page)
+        content.append(page)
 
         first = False
 
-    node.append(pages)
+    node.append(content)
+    # The paragraphs are in the tree now; don't pickle them twice.
+    node.parts = []
 
+
+def visit_pages_node_html(self, node):
     self.body.append(self.starttag(node, 'div'))
 
 
@@ -116,17 +148,53 @@ def depart_pages_node_html(self, node):
 
 
 def visit_pages_node_latex(self, node):
-    for part in node.parts:
-        t = tab('', '')
-        t.label = part.label
-        t.append(part.paragraph)
-        node.append(t)
+    pass
 
 
 def depart_pages_node_latex(self, node):
     pass
 
 
+def visit_tab_nav_node_html(self, node):
+    pass
+
+
+def depart_tab_nav_node_html(self, node):
+    pass
+
+
+def visit_tab_nav_node_latex(self, node):
+    raise nodes.SkipNode
+
+
+def depart_tab_nav_node_latex(self, node):
+    pass
+
+
+def visit_tab_content_node_html(self, node):
+    self.visit_section(node)
+
+
+def depart_tab_content_node_html(self, node):
+    self.depart_section(node)
+
+
+def visit_tab_content_node_latex(self, node):
+    pass
+
+
+def depart_tab_content_node_latex(self, node):
+    pass
+
+
+def visit_tab_pane_node_latex(self, node):
+    self.body.append(r'\begin{jsonframe}{%s}{black}' % node['label'])
+
+
+def depart_tab_pane_node_latex(self, node):
+    self.body.append(r'\end{jsonframe}')
+
+
 class tab(nodes.General, nodes.Inline, nodes.Referential, nodes.TextElement):
     pass
 
@@ -143,30 +211,34 @@ def depart_tab_node_html(self, node):
     self.body.append('</a>')
 
 
-def visit_tab_node_latex(self, node):
-    self.body.append(r'\begin{jsonframe}{%s}{black}' % node.label)
-
-
-def depart_tab_node_latex(self, node):
-    self.body.append(r'\end{jsonframe}')
-
-
 def make_id(self, label):
-    return '{0}_{1}'.format(hex(id(self))[2:], re.sub(r"\W", "_", label))
+    return '{0}_{1}'.format(self['tab_prefix'], re.sub(r"\W", "_", label))
 
 
 class TabDirective(Directive):
     has_content = True
 
     def run(self):
-        parts = split_content(self.content)
+        with profiler.directive(self, self.name):
+            return self.make_nodes()
+
+    def make_nodes(self):
+        env = self.state.document.settings.env
+        parts = split_content(self.content, content_first_line(self))
         container = self.make_container(parts)
+        # Derived from the document and the position of the block in it,
+        # so that unchanged pages are written out identically.
+        container['tab_prefix'] = re.sub(r"\W", "_", '{0}_tabs{1}'.format(
+            env.docname, env.new_serialno('tabs')))
 
         for part in parts:
             paragraph = nodes.paragraph('', '')
-            content = statemachine.StringList(part.content)
-            content.parent = self.content.parent
-            self.state.nested_parse(content, 0, paragraph)
+            # Slicing the directive content keeps the source and line of
+            # every line, so errors in the nested content point at them.
+            content = self.content[
+                part.offset:part.offset + len(part.content)]
+            self.state.nested_parse(
+                content, self.content_offset + part.offset, paragraph)
             part.paragraph = paragraph
 
         return [container]
@@ -183,9 +255,23 @@ class DraftDirective(TabDirective):
 
 
 def setup(app):
+    app.setup_extension('sphinxext.profile')
+
     app.add_node(tab,
-                 html=(visit_tab_node_html, depart_tab_node_html),
-                 latex=(visit_tab_node_latex, depart_tab_node_latex))
+                 html=(visit_tab_node_html, depart_tab_node_html))
+    app.add_node(tab_nav,
+                 html=(visit_tab_nav_node_html, depart_tab_nav_node_html),
+                 latex=(visit_tab_nav_node_latex, depart_tab_nav_node_latex))
+    app.add_node(tab_content,
+                 html=(visit_tab_content_node_html,
+                       depart_tab_content_node_html),
+                 latex=(visit_tab_content_node_latex,
+                        depart_tab_content_node_latex))
+    app.add_node(tab_pane,
+                 html=(visit_tab_content_node_html,
+                       depart_tab_content_node_html),
+                 latex=(visit_tab_pane_node_latex,
+                        depart_tab_pane_node_latex))
     app.add_node(language_specific_pages,
                  html=(visit_pages_node_html,
                        depart_pages_node_html),
@@ -197,9 +283,17 @@ def setup(app):
                  latex=(visit_pages_node_latex,
                         depart_pages_node_latex))
 
+    app.add_transform(TabTransform)
+
     app.add_directive('language_specific', LanguageSpecificDirective)
     app.add_directive('draft_specific', DraftDirective)
 
+    return {
+        'env_version': 3,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
+
 
 latex_preamble = r"""
   \usepackage{mdframed}
@@ -0,0 +1,64 @@
+"""
+Incremental builds after an edit to a schema in `jsonschema_schema_dir`.
+"""
+import io
+import os
+
+import pytest
+from sphinx.application import Sphinx
+
+SRCDIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'source')
+
+CONF = """
+import sys
+sys.path.insert(0, {srcdir!r})
+extensions = ['sphinxext.jsonschemaext']
+master_doc = 'index'
+jsonschema_standard = 'https://json-schema.org/draft/2020-12/schema'
+jsonschema_schema_dir = '_schemas'
+"""
+
+INDEX = """
+Registry
+========
+
+.. schema_example::
+
+    { "$ref": "https://example.com/schemas/name" }
+    --
+    "Ada"
+"""
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as fd:
+        fd.write(text)
+
+
+def write_schema(srcdir, type):
+    write(os.path.join(srcdir, '_schemas', 'name.json'),
+          '{{"$id": "https://example.com/schemas/name", '
+          '"type": "{0}"}}'.format(type))
+
+
+def build(outdir):
+    srcdir = os.path.join(outdir, 'source')
+    app = Sphinx(srcdir, srcdir, os.path.join(outdir, 'html'),
+                 os.path.join(outdir, 'doctrees'), 'html',
+                 status=io.StringIO(), warning=io.StringIO())
+    app.build()
+
+
+def test_registry_edit_rereads_dependent_documents(tmp_path):
+    outdir = str(tmp_path)
+    srcdir = os.path.join(outdir, 'source')
+    write(os.path.join(srcdir, 'conf.py'), CONF.format(srcdir=SRCDIR))
+    write(os.path.join(srcdir, 'index.rst'), INDEX)
+    write_schema(srcdir, 'string')
+    build(outdir)
+
+    write_schema(srcdir, 'number')
+    with pytest.raises(ValueError, match='should pass'):
+        build(outdir)